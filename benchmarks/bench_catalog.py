@@ -0,0 +1,63 @@
+"""Catálogo binário mapeado em memória vs. feed CSV: tempo para abrir e precificar o catálogo inteiro.
+
+Gera um catálogo sintético nos dois formatos e mede, para cada um, a carga (parse do CSV ou
+abertura do memmap) e a precificação completa até a matriz de preços.
+
+Uso: python benchmarks/bench_catalog.py [--products N] [--workers N]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import mercado_livre_price_optimizer as mlpo  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    produtos = [
+        (f"Produto Sintético {i}", round(rng.uniform(50, 20000), 2), round(rng.uniform(30, 15000), 2))
+        for i in range(args.products)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        csv_path, cat_path = tmp / "catalogo.csv", tmp / "catalogo.bin"
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("name,new_price,used_price\n")
+            f.writelines(f"{nome},{novo:.2f},{usado:.2f}\n" for nome, novo, usado in produtos)
+        mlpo.write_catalog(cat_path, produtos)
+
+        t0 = time.perf_counter()
+        records = list(mlpo.iter_feed(csv_path))
+        t_csv_load = time.perf_counter() - t0
+        matrix_csv = mlpo.compute_price_matrix([r.new_price for r in records], [r.used_price for r in records])
+        t_csv = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        catalog = mlpo.Catalog(cat_path)
+        t_cat_open = time.perf_counter() - t0
+        matrix_cat = mlpo.price_catalog(cat_path, tmp / "matriz.npy", workers=args.workers)
+        t_cat = time.perf_counter() - t0
+
+        print(f"{len(catalog):,} produtos, {matrix_cat.shape[1]} regras")
+        print(f"{'Fonte':<22}  {'carga (ms)':>11}  {'total (s)':>9}")
+        print("-" * 46)
+        print(f"{'feed CSV':<22}  {t_csv_load * 1000:>11.1f}  {t_csv:>9.3f}")
+        print(f"{'catálogo memmap':<22}  {t_cat_open * 1000:>11.3f}  {t_cat:>9.3f}")
+        print(f"Matrizes idênticas: {np.array_equal(matrix_csv, matrix_cat)}")
+
+
+if __name__ == "__main__":
+    main()
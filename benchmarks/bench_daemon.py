@@ -0,0 +1,107 @@
+"""Latência do servidor residente (--serve) para cotações em texto sob carga.
+
+Sobe o servidor num subprocesso, abre C conexões keep-alive e dispara N pedidos
+POST /quote?format=text; mostra p50/p95/p99 e a vazão.
+
+Uso: python benchmarks/bench_daemon.py [--requests N] [--concurrency C] [--format text|json]
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "src" / "mercado_livre_price_optimizer.py"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError("servidor não subiu a tempo")
+
+
+async def _client(port: int, n: int, fmt: str, latencies: list[float], rng: random.Random) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for i in range(n):
+            body = json.dumps({
+                "name": f"Produto {rng.randrange(10_000)}",
+                "new_price": round(rng.uniform(50, 20000), 2),
+                "used_price": round(rng.uniform(30, 15000), 2),
+            }).encode()
+            request = (
+                f"POST /quote?format={fmt} HTTP/1.1\r\nHost: bench\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+            ).encode() + body
+            t0 = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = next(
+                int(ln.split(b":", 1)[1]) for ln in head.split(b"\r\n") if ln.lower().startswith(b"content-length")
+            )
+            await reader.readexactly(length)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if not head.startswith(b"HTTP/1.1 200"):
+                raise RuntimeError(head.decode(errors="replace"))
+    finally:
+        writer.close()
+
+
+async def _run(port: int, total: int, concurrency: int, fmt: str) -> tuple[list[float], float]:
+    await _wait_ready(port)
+    # aquecimento
+    await _client(port, 50, fmt, [], random.Random(0))
+    latencies: list[float] = []
+    per_client = max(1, total // concurrency)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(
+        _client(port, per_client, fmt, latencies, random.Random(i + 1)) for i in range(concurrency)
+    ))
+    return latencies, time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    args = parser.parse_args()
+
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, str(SCRIPT), "--serve", f"127.0.0.1:{port}", "--renderer", "pillow"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        latencies, elapsed = asyncio.run(_run(port, args.requests, args.concurrency, args.format))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    latencies.sort()
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{len(latencies):,} pedidos format={args.format}, {args.concurrency} conexões keep-alive")
+    print(f"vazão: {len(latencies) / elapsed:,.0f} pedidos/s")
+    print(f"p50 {q[49]:.2f} ms | p95 {q[94]:.2f} ms | p99 {q[98]:.2f} ms | máx {latencies[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Formatação BRL: _fmt_money antigo vs. novo escalar vs. _fmt_money_array, com verificação de propriedades.
+
+Antes de medir, confere em valores aleatórios (e em casos de borda) que:
+  - _fmt_money_array, sem o preenchimento à esquerda, é idêntico a _fmt_money valor a valor
+    (os casos de borda vão um a um, repetidos até o mínimo do caminho vetorizado, para que um
+    valor fora da faixa não desvie o lote inteiro para o caminho escalar);
+  - o novo _fmt_money é idêntico ao antigo, exceto quando a fração arredonda para 1,00 (o antigo
+    escrevia ",00" sem somar 1 à parte inteira); nesses casos o novo escreve inteiro + 1 e ",00".
+
+Uso: python benchmarks/bench_fmt_money.py [--values N] [--checks N] [--check]
+
+Com --check só a verificação roda (sem medir), saindo com código 1 se houver divergência;
+é o modo para CI. Os mesmos casos são cobertos por tests/test_fmt_money.py (pytest).
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import mercado_livre_price_optimizer as mlpo  # noqa: E402
+
+
+def legacy_fmt_money(v: float) -> str:
+    inteiro, frac = divmod(abs(v), 1)
+    s_inteiro = f"{int(inteiro):,}".replace(",", ".")
+    s_frac = f"{frac:.2f}".split(".")[1]
+    return f"R$ {'-' if v < 0 else ''}{s_inteiro},{s_frac}"
+
+
+EDGE_CASES = [
+    0.0, -0.0, 0.004, 0.005, -0.004, 0.995, 2.995, 999.995, 999.999, 1000.0, 999999.995,
+    1234567.89, -1234.5, 0.01, 0.1 + 0.2, 1e14 + 0.5, 1e14 + 0.25, -3.5e14 + 0.75, 2.0**53 / 100 + 0.125,
+]
+
+
+def _random_values(n: int, rng: random.Random) -> list[float]:
+    values = []
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.5:
+            v = round(rng.lognormvariate(6, 2.5), 2)
+        elif r < 0.8:
+            v = rng.lognormvariate(6, 2.5)
+        else:
+            v = rng.randrange(10**7) + rng.choice((0.005, 0.995, 0.9949999, 0.9950001, 0.125))
+        values.append(-v if rng.random() < 0.1 else v)
+    return values
+
+
+def _expected_from_legacy(v: float) -> str:
+    old = legacy_fmt_money(v)
+    inteiro, frac = divmod(abs(v), 1)
+    if f"{frac:.2f}" != "1.00":
+        return old
+    return f"R$ {'-' if v < 0 else ''}{int(inteiro) + 1:,}".replace(",", ".") + ",00"
+
+
+def check_properties(values: list[float], one_by_one: bool = False) -> list[str]:
+    problems = []
+    if one_by_one:
+        batch = [mlpo._fmt_money_array([v] * mlpo._FMT_ARRAY_MIN)[0].lstrip() for v in values]
+    else:
+        batch = [s.lstrip() for s in mlpo._fmt_money_array(values)]
+    for v, b in zip(values, batch):
+        scalar = mlpo._fmt_money(v)
+        if b != scalar:
+            problems.append(f"{v!r}: lote {b!r} != escalar {scalar!r}")
+        expected = _expected_from_legacy(v)
+        if scalar != expected:
+            problems.append(f"{v!r}: novo {scalar!r} != esperado {expected!r} (antigo {legacy_fmt_money(v)!r})")
+    return problems
+
+
+def _time(fn, values: list[float]) -> float:
+    t0 = time.perf_counter()
+    fn(values)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--values", type=int, default=1_000_000)
+    parser.add_argument("--checks", type=int, default=200_000)
+    parser.add_argument("--check", action="store_true", help="só confere as propriedades, sem medir")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    problems = check_properties(EDGE_CASES, one_by_one=True) + check_properties(_random_values(args.checks, rng))
+    print(f"Propriedades: {args.checks + len(EDGE_CASES):,} valores conferidos, {len(problems)} divergências")
+    for p in problems[:10]:
+        print(f" - {p}")
+    if args.check:
+        sys.exit(1 if problems else 0)
+
+    values = [round(rng.lognormvariate(6.5, 1.5), 2) for _ in range(args.values)]
+    cases = {
+        "antigo, por valor": lambda vs: [legacy_fmt_money(v) for v in vs],
+        "novo, por valor": lambda vs: [mlpo._fmt_money(v) for v in vs],
+        "_fmt_money_array": mlpo._fmt_money_array,
+    }
+    print(f"\n{len(values):,} preços")
+    print(f"{'Formatador':<20}  {'total (s)':>9}  {'ns/valor':>9}  {'speedup':>8}")
+    print("-" * 52)
+    base = None
+    for name, fn in cases.items():
+        elapsed = _time(fn, values)
+        base = base or elapsed
+        print(f"{name:<20}  {elapsed:>9.3f}  {elapsed / len(values) * 1e9:>9.0f}  {base / elapsed:>7.2f}x")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
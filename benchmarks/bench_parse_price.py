@@ -0,0 +1,102 @@
+"""Microbenchmark de _parse_price sobre strings de preço realistas (com repetição, como nos feeds).
+
+Compara o parser antigo (str.replace encadeados), o novo sem cache e o novo com cache LRU,
+e confere o resultado de cada um contra o valor que gerou a string. O antigo lê "R$ 1.234" e
+"1.234" (milhar sem centavos) como 1,234; essas divergências só são contadas, as do novo falham.
+
+Uso: python benchmarks/bench_parse_price.py [--count N] [--distinct N]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import mercado_livre_price_optimizer as mlpo  # noqa: E402
+
+
+def legacy_parse_price(s: str) -> float:
+    s = s.strip().replace("R$", "").replace(" ", "")
+    if "," in s and "." in s:
+        s = s.replace(".", "").replace(",", ".")
+    elif "," in s:
+        s = s.replace(",", ".")
+    return float(s)
+
+
+def _br(v: float) -> str:
+    inteiro, cents = divmod(round(v * 100), 100)
+    return f"{inteiro:,}".replace(",", ".") + f",{cents:02d}"
+
+
+def realistic_prices(count: int, distinct: int, seed: int = 7) -> tuple[list[str], dict[str, float]]:
+    """(strings com repetição, valor esperado de cada string distinta)."""
+    rng = random.Random(seed)
+    expected = {}
+    for _ in range(distinct):
+        v = round(rng.lognormvariate(6.5, 1.2), 2)
+        style = rng.random()
+        if style < 0.40:
+            expected[f"R$ {_br(v)}"] = v
+        elif style < 0.60:
+            expected[_br(v)] = v
+        elif style < 0.80:
+            expected[str(int(v))] = float(int(v))
+        elif style < 0.90:
+            # "R$ 1.234" / "1.234": milhar com ponto e sem centavos, com ou sem o prefixo
+            milhar = f"{int(v) + 1000:,}".replace(",", ".")
+            expected[f"R$ {milhar}" if style < 0.85 else milhar] = float(int(v) + 1000)
+        else:
+            expected[f"{v:.2f}".replace(".", ",")] = v
+    pool = list(expected)
+    # poucos preços concentram a maior parte das ocorrências, como num catálogo real
+    weights = [1.0 / (i + 1) for i in range(len(pool))]
+    return rng.choices(pool, weights=weights, k=count), expected
+
+
+def _time(fn, data: list[str]) -> tuple[float, list[float]]:
+    t0 = time.perf_counter()
+    out = [fn(s) for s in data]
+    return time.perf_counter() - t0, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--distinct", type=int, default=20_000)
+    args = parser.parse_args()
+
+    data, expected = realistic_prices(args.count, args.distinct)
+    mlpo._parse_price.cache_clear()
+    cases = {
+        "legado (str.replace)": legacy_parse_price,
+        "novo, sem cache": mlpo._parse_price.__wrapped__,
+        "novo, cache LRU": mlpo._parse_price,
+    }
+
+    print(f"{len(data):,} strings, {len(set(data)):,} distintas")
+    print(f"{'Parser':<22}  {'total (s)':>9}  {'ns/string':>10}  {'speedup':>8}")
+    print("-" * 56)
+    results = {}
+    base = None
+    for name, fn in cases.items():
+        elapsed, results[name] = _time(fn, data)
+        base = base or elapsed
+        print(f"{name:<22}  {elapsed:>9.3f}  {elapsed / len(data) * 1e9:>10.0f}  {base / elapsed:>7.2f}x")
+
+    reference = [expected[s] for s in data]
+    divergent = {name: sum(1 for a, b in zip(reference, out) if a != b) for name, out in results.items()}
+    print()
+    for name, n in divergent.items():
+        print(f"Divergências do valor esperado, {name}: {n:,}")
+    mismatches = sum(n for name, n in divergent.items() if name != "legado (str.replace)")
+    info = mlpo._parse_price.cache_info()
+    print(f"Cache: {info.hits:,} acertos, {info.misses:,} faltas, {info.currsize:,}/{info.maxsize:,} entradas")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compara os backends de PNG: ms por imagem e bytes por imagem.
+
+Uso: python benchmarks/bench_renderers.py [--products N]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import mercado_livre_price_optimizer as mlpo  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    produtos = [
+        (f"Produto Sintético {i} Edição Especial", round(rng.uniform(50, 20000), 2), round(rng.uniform(30, 15000), 2))
+        for i in range(args.products)
+    ]
+
+    print(f"{'Renderizador':<12}  {'ms/imagem':>10}  {'KB/imagem':>10}")
+    print("-" * 36)
+    with tempfile.TemporaryDirectory() as tmp:
+        for renderer in mlpo.PNG_RENDERERS:
+            out_dir = Path(tmp) / renderer
+            out_dir.mkdir()
+            # primeira imagem fora da medição: import do backend e carga da fonte
+            mlpo.save_png_table(mlpo.compute_rows(100.0, 50.0), "aquecimento", out_dir / "warmup.png", renderer)
+            total_bytes = 0
+            t0 = time.perf_counter()
+            for i, (nome, novo, usado) in enumerate(produtos):
+                path = mlpo.save_png_table(mlpo.compute_rows(novo, usado), nome, out_dir / f"{i}.png", renderer)
+                total_bytes += path.stat().st_size
+            elapsed = time.perf_counter() - t0
+            n = len(produtos)
+            print(f"{renderer:<12}  {elapsed / n * 1000:>10.1f}  {total_bytes / n / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
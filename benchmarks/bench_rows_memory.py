@@ -0,0 +1,63 @@
+"""Memória por produto precificado: linhas como dicts (formato antigo) vs. PriceRow com __slots__.
+
+Uso: python benchmarks/bench_rows_memory.py [--products N]
+"""
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import mercado_livre_price_optimizer as mlpo  # noqa: E402
+
+
+def legacy_compute_rows(preco_novo: float, preco_usado: float) -> list[dict]:
+    base_map = {"Produto Novo": preco_novo, "Produto Usado": preco_usado}
+    rows: list[dict] = []
+    for tipo, rules in mlpo.RULES.items():
+        base = base_map[tipo]
+        rows.extend(
+            {
+                "Tipo": tipo,
+                "Categoria": label,
+                "Multiplicador": mult,
+                "Preço Otimizado": round(base * mult, 2),
+            }
+            for label, mult in rules
+        )
+    return rows
+
+
+def _bytes_per_product(fn, prices: list[tuple[float, float]]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    kept = [fn(novo, usado) for novo, usado in prices]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current / len(prices)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    prices = [(round(rng.uniform(50, 20000), 2), round(rng.uniform(30, 15000), 2)) for _ in range(args.products)]
+
+    before = _bytes_per_product(legacy_compute_rows, prices)
+    after = _bytes_per_product(mlpo.compute_rows, prices)
+    print(f"{args.products:,} produtos, {len(mlpo.compute_rows(1.0, 1.0))} linhas por produto")
+    print(f"{'Representação':<24}  {'bytes/produto':>13}")
+    print("-" * 39)
+    print(f"{'list[dict] (antigo)':<24}  {before:>13.0f}")
+    print(f"{'list[PriceRow]':<24}  {after:>13.0f}")
+    print(f"Redução: {1 - after / before:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Tempo de partida a frio do script: execução só texto (--no-png) vs. execução completa.
+
+Uso: python benchmarks/bench_startup.py [--runs N]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = ROOT / "src" / "mercado_livre_price_optimizer.py"
+INPUT = ROOT / "input" / "product"
+
+
+def _time_run(cmd: list[str], runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = {
+            "import do módulo": [sys.executable, "-c", f"import sys; sys.path.insert(0, {str(SCRIPT.parent)!r}); "
+                                                       "import mercado_livre_price_optimizer"],
+            "execução só texto (--no-png)": [sys.executable, str(SCRIPT), str(INPUT), "--output-dir", tmp, "--no-png"],
+            "execução completa (PNG + txt)": [sys.executable, str(SCRIPT), str(INPUT), "--output-dir", tmp],
+        }
+        # aquece o cache de disco / bytecode antes de medir
+        for cmd in cases.values():
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        print(f"{'Cenário':<32}  {'mediana (ms)':>12}  {'mín (ms)':>9}  {'máx (ms)':>9}")
+        print("-" * 68)
+        for name, cmd in cases.items():
+            samples = _time_run(cmd, args.runs)
+            print(f"{name:<32}  {statistics.median(samples):>12.1f}  {min(samples):>9.1f}  {max(samples):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
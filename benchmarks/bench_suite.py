@@ -0,0 +1,186 @@
+"""Suíte de benchmarks: _parse_price, compute_rows, _fmt_money, _format_block, _build_output_lines e save_png_table.
+
+Roda cada função sobre catálogos sintéticos (1, 1k, 100k e 1M produtos por padrão), grava os
+resultados em JSON e compara com um baseline salvo anteriormente (ns por item; acima de
+--tolerance conta como regressão). Tudo é gerado localmente, sem rede.
+
+save_png_table é cara demais para o catálogo inteiro: mede no máximo --png-limit imagens por
+tamanho e extrapola o ns/item.
+
+Uso:
+  python benchmarks/bench_suite.py [--sizes 1,1000,100000,1000000] [--out resultados.json]
+                                   [--baseline baseline.json] [--save-baseline] [--tolerance 0.10]
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import mercado_livre_price_optimizer as mlpo  # noqa: E402
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_SIZES = (1, 1_000, 100_000, 1_000_000)
+MIN_TIME = 0.2  # tamanhos pequenos repetem até somar pelo menos isso, e fica o melhor
+
+
+def _br(v: float) -> str:
+    inteiro, cents = divmod(round(v * 100), 100)
+    return f"{inteiro:,}".replace(",", ".") + f",{cents:02d}"
+
+
+def synthetic_catalog(n: int, seed: int = 20) -> list[tuple[str, str, str]]:
+    """(nome, preço novo, preço usado) como texto, nos formatos que aparecem nos arquivos de entrada."""
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(n):
+        novo = round(rng.lognormvariate(6.5, 1.2), 2)
+        usado = round(novo * rng.uniform(0.4, 0.95), 2)
+        if i % 3 == 0:
+            catalog.append((f"Produto Sintético {i}", f"R$ {_br(novo)}", _br(usado)))
+        elif i % 3 == 1:
+            catalog.append((f"Produto Sintético {i}", f"{novo:.2f}", f"{usado:.2f}"))
+        else:
+            catalog.append((f"Produto Sintético {i}", str(int(novo) + 1), str(int(usado) + 1)))
+    return catalog
+
+
+def _measure(fn, items: list, min_time: float = MIN_TIME) -> dict:
+    best, runs, total = float("inf"), 0, 0.0
+    while runs == 0 or total < min_time:
+        t0 = time.perf_counter()
+        fn(items)
+        elapsed = time.perf_counter() - t0
+        best = min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return {"items": len(items), "runs": runs, "seconds": best, "ns_per_item": best / max(1, len(items)) * 1e9}
+
+
+def run_suite(sizes: list[int], png_limit: int, renderer: str) -> dict:
+    results: dict[str, dict[str, dict]] = {}
+
+    def record(name: str, size: int, m: dict) -> None:
+        results.setdefault(name, {})[str(size)] = m
+        print(f"{name:<20}  {size:>9,}  {m['items']:>10,}  {m['ns_per_item']:>12,.0f}", flush=True)
+
+    print(f"{'Função':<20}  {'catálogo':>9}  {'itens':>10}  {'ns/item':>12}")
+    print("-" * 57)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # aquecimento: import do backend de PNG e fonte fora da medição
+        mlpo.save_png_table(mlpo.compute_rows(100.0, 50.0), "aquecimento", tmp / "aquecimento.png", renderer)
+        for size in sizes:
+            catalog = synthetic_catalog(size)
+            price_strings = [p for _, novo, usado in catalog for p in (novo, usado)]
+
+            def parse(items):
+                mlpo._parse_price.cache_clear()
+                for s in items:
+                    mlpo._parse_price(s)
+
+            record("_parse_price", size, _measure(parse, price_strings))
+            mlpo._parse_price.cache_clear()
+            prices = [(mlpo._parse_price(novo), mlpo._parse_price(usado)) for _, novo, usado in catalog]
+            record("compute_rows", size, _measure(lambda items: [mlpo.compute_rows(a, b) for a, b in items], prices))
+            all_rows = [mlpo.compute_rows(a, b) for a, b in prices]
+            money = [r.preco for rows in all_rows for r in rows]
+            record("_fmt_money", size, _measure(lambda items: [mlpo._fmt_money(v) for v in items], money))
+            blocks = [
+                (rows[rng.start:rng.stop], tipo)
+                for rows in all_rows
+                for tipo, rng in zip(rows[0].table.tipos, rows[0].table.tipo_rules)
+            ]
+            record("_format_block", size, _measure(lambda items: [mlpo._format_block(g, t) for g, t in items], blocks))
+            products = list(zip((nome for nome, _, _ in catalog), all_rows))
+            record(
+                "_build_output_lines", size,
+                _measure(lambda items: [mlpo._build_output_lines(rows, nome) for nome, rows in items], products),
+            )
+            del money, blocks, price_strings
+
+            png_items = products[:png_limit]
+            record(
+                "save_png_table", size,
+                _measure(
+                    lambda items: [
+                        mlpo.save_png_table(rows, nome, tmp / f"{i}.png", renderer) for i, (nome, rows) in enumerate(items)
+                    ],
+                    png_items,
+                    min_time=0.0,
+                ),
+            )
+            del products, all_rows, prices, catalog
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    print(f"\nComparação com o baseline ({baseline.get('meta', {}).get('timestamp', '?')}):")
+    print(f"{'Função':<20}  {'catálogo':>9}  {'antes ns':>10}  {'agora ns':>10}  {'razão':>6}")
+    print("-" * 63)
+    for name, by_size in results.items():
+        for size, m in by_size.items():
+            ref = baseline.get("results", {}).get(name, {}).get(size)
+            if ref is None:
+                continue
+            ratio = m["ns_per_item"] / ref["ns_per_item"]
+            flag = " <-- regressão" if ratio > 1 + tolerance else ""
+            print(f"{name:<20}  {int(size):>9,}  {ref['ns_per_item']:>10,.0f}  {m['ns_per_item']:>10,.0f}  "
+                  f"{ratio:>5.2f}x{flag}")
+            if flag:
+                regressions.append(f"{name} @ {size}: {ratio:.2f}x")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="tamanhos de catálogo separados por vírgula")
+    parser.add_argument("--png-limit", type=int, default=20, help="máximo de PNGs medidos por tamanho")
+    parser.add_argument("--renderer", choices=mlpo.PNG_RENDERERS, default="matplotlib")
+    parser.add_argument("--out", type=Path, help="grava os resultados neste JSON")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="JSON de referência para comparar")
+    parser.add_argument("--save-baseline", action="store_true", help="grava os resultados como o novo baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="piora relativa aceita antes de acusar regressão")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = run_suite(sizes, args.png_limit, args.renderer)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "renderer": args.renderer,
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nResultados gravados em {args.out}")
+
+    regressions = []
+    if args.baseline.exists() and not args.save_baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nBaseline gravado em {args.baseline}")
+    if regressions:
+        print(f"\n{len(regressions)} regressões acima de {args.tolerance:.0%}: " + "; ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Varredura densa de multiplicadores (sweep_tiers): tempo no catálogo inteiro e conferência escalar.
+
+Gera N produtos com custo e preço de concorrente, varre a grade padrão (0,30 a 1,00, passo
+0,001) com patamares por margem alvo e por undercut, e confere uma amostra contra uma busca
+candidato a candidato em Python puro.
+
+Uso: python benchmarks/bench_sweep.py [--products N] [--checks N]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import mercado_livre_price_optimizer as mlpo  # noqa: E402
+
+TIERS = (
+    mlpo.SweepTier("Margem 15%", "margem", 0.15),
+    mlpo.SweepTier("Margem 30%", "margem", 0.30),
+    mlpo.SweepTier("Concorrente -3%", "undercut", 0.03),
+    mlpo.SweepTier("Concorrente -5%, margem 10%", "undercut", 0.05, min_margin=0.10),
+)
+
+
+def brute_force(base: float, custo: float, concorrente: float, tier: mlpo.SweepTier, mults) -> float:
+    escolhido = float("nan")
+    for m in mults:
+        preco = float(mlpo._round2(np.array([base * m]))[0])
+        margem_ok = tier.min_margin is None or preco - custo >= tier.min_margin * preco
+        if tier.kind == "margem":
+            if preco - custo >= tier.value * preco:
+                return preco
+        elif preco <= concorrente * (1 - tier.value) and margem_ok:
+            escolhido = preco
+    return escolhido
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--checks", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(23)
+    bases = np.round(rng.lognormal(6.5, 1.2, args.products), 2)
+    custos = np.round(bases * rng.uniform(0.2, 0.7, args.products), 2)
+    concorrentes = np.round(bases * rng.uniform(0.4, 1.05, args.products), 2)
+    grid = mlpo.SweepGrid()
+    mults = grid.multipliers()
+
+    t0 = time.perf_counter()
+    result = mlpo.sweep_tiers(bases, TIERS, grid, custos=custos, concorrentes=concorrentes)
+    elapsed = time.perf_counter() - t0
+    cells = args.products * len(mults)
+    print(f"{args.products:,} produtos x {len(mults)} candidatos x {len(TIERS)} patamares")
+    print(f"total: {elapsed:.3f} s | {elapsed / args.products * 1e6:.2f} us/produto | "
+          f"{cells / elapsed / 1e6:,.0f} M candidatos/s")
+    for t, tier in enumerate(TIERS):
+        print(f"  {tier.label:<30} sem candidato: {np.isnan(result.precos[:, t]).sum():>8,}")
+
+    divergencias = 0
+    for i in random.Random(5).sample(range(args.products), min(args.checks, args.products)):
+        for t, tier in enumerate(TIERS):
+            esperado = brute_force(bases[i], custos[i], concorrentes[i], tier, mults)
+            obtido = result.precos[i, t]
+            if not (esperado == obtido or (np.isnan(esperado) and np.isnan(obtido))):
+                divergencias += 1
+                print(f"  produto {i} {tier.label}: varredura {obtido} != escalar {esperado}")
+    print(f"Conferência escalar: {args.checks} produtos, {divergencias} divergências")
+    if divergencias:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
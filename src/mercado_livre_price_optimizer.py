@@ -1,7 +1,30 @@
+import argparse
+import csv
+import functools
+import glob
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
+import math
+import re
+import sqlite3
+import struct
 import sys
+import tempfile
+import threading
+import time
+import tomllib
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import astuple, dataclass, field
 from pathlib import Path
+from typing import NamedTuple
 import unicodedata
-import matplotlib.pyplot as plt
+import zipfile
+import numpy as np
 
 RULES: dict[str, list[tuple[str, float]]] = {
     "Produto Novo": [
@@ -23,18 +46,619 @@ RULES: dict[str, list[tuple[str, float]]] = {
 }
 
 
+# coluna de preço base (0 = novo, 1 = usado) de cada tipo de produto
+_BASE_NAMES = {"novo": 0, "usado": 1}
+_BASE_COLUMNS = {"Produto Novo": 0, "Produto Usado": 1}
+
+
+@dataclass(frozen=True)
+class FeeModel:
+    """Custos do marketplace sobre um preço de venda, para chegar ao valor líquido do anúncio.
+
+    ``comissao``: faixas (preço a partir do qual vale, fração), em ordem crescente; abaixo da
+    primeira faixa não há comissão. ``taxa_fixa`` é cobrada por unidade em preços abaixo de
+    ``limite_taxa_fixa``; ``frete`` (subsídio do frete grátis) a partir de ``limite_frete``.
+    Sem limite, a taxa fixa e o frete valem para qualquer preço.
+    """
+
+    comissao: tuple[tuple[float, float], ...] = ()
+    taxa_fixa: float = 0.0
+    limite_taxa_fixa: float = float("inf")
+    frete: float = 0.0
+    limite_frete: float = 0.0
+
+    def net(self, precos) -> np.ndarray:
+        """Valor líquido de cada preço (qualquer formato de array), arredondado a centavos."""
+        precos = np.asarray(precos, dtype=np.float64)
+        liquido = precos.copy()
+        if self.comissao:
+            limites = np.array([limite for limite, _ in self.comissao])
+            fracoes = np.array([0.0] + [fracao for _, fracao in self.comissao])
+            liquido -= precos * fracoes[np.searchsorted(limites, precos, side="right")]
+        if self.taxa_fixa:
+            liquido -= np.where(precos < self.limite_taxa_fixa, self.taxa_fixa, 0.0)
+        if self.frete:
+            liquido -= np.where(precos >= self.limite_frete, self.frete, 0.0)
+        return _round2(liquido)
+
+
+# terminação -> (centavos finais, período em centavos): ",90", ",99" e reais terminados em 9 ("…9,00")
+PRICE_ENDINGS = {"90": (90, 100), "99": (99, 100), "9": (900, 1000)}
+ENDING_DIRECTIONS = ("proximo", "abaixo")
+
+
+@dataclass(frozen=True)
+class PriceEndings:
+    """Terminações psicológicas aplicadas ao preço otimizado.
+
+    Cada preço vai para o candidato mais próximo entre as terminações de ``finais`` (chaves de
+    PRICE_ENDINGS; em empate vale a que vem antes), desde que a distância não passe de
+    ``tolerancia`` x preço; senão o preço fica como está. Com ``direcao = "abaixo"`` só
+    candidatos menores ou iguais ao preço contam.
+    """
+
+    finais: tuple[str, ...] = ("90",)
+    tolerancia: float = 0.02
+    direcao: str = "proximo"
+
+    def snap(self, precos) -> np.ndarray:
+        """Preços (qualquer formato de array, já em centavos) com a terminação aplicada.
+
+        Valores fora da faixa em que centavos são exatos em float64 (|preço| >= _FMT_ARRAY_MAX,
+        inclusive NaN e infinitos) não cabem no int64 e saem sem terminação.
+        """
+        precos = np.asarray(precos, dtype=np.float64)
+        in_range = np.abs(precos) < _FMT_ARRAY_MAX
+        cents = np.rint(np.where(in_range, precos, 0.0) * 100.0).astype(np.int64)
+        best = cents.copy()
+        best_dist = np.full(cents.shape, np.inf)
+        limite = self.tolerancia * cents
+        for final in self.finais:
+            fim, periodo = PRICE_ENDINGS[final]
+            cand = cents - (cents - fim) % periodo
+            if self.direcao == "proximo":
+                acima = cand + periodo
+                cand = np.where((acima - cents < cents - cand) | (cand <= 0), acima, cand)
+            dist = np.abs(cand - cents)
+            ok = (cand > 0) & (dist <= limite) & (dist < best_dist)
+            best = np.where(ok, cand, best)
+            best_dist = np.where(ok, dist, best_dist)
+        return np.where(in_range, best / 100.0, precos)
+
+
+@dataclass(frozen=True, eq=False)
+class RuleTable:
+    """RULES compilado uma vez: rótulos internados, arrays de multiplicadores e larguras de coluna.
+
+    As regras ficam achatadas na ordem de compute_rows (as de um mesmo tipo são contíguas);
+    os arrays NumPy são somente leitura.
+    """
+
+    tipos: tuple[str, ...]
+    entries: tuple[tuple[str, str, float], ...]  # (tipo, categoria, multiplicador) por regra
+    rule_tipo: tuple[int, ...]
+    rule_base: tuple[int, ...]
+    tipo_rules: tuple[range, ...]
+    categoria_widths: tuple[int, ...]  # largura das colunas Categoria e Multiplicador de cada tipo
+    multiplicador_widths: tuple[int, ...]
+    multipliers: np.ndarray
+    base_index: np.ndarray
+    version: str
+    fees: tuple[FeeModel, ...] | None = None  # um modelo por tipo, ou None sem custos configurados
+    endings: tuple[PriceEndings | None, ...] | None = None  # terminações por tipo, ou None sem terminações
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def compile_rules(
+    rules: dict[str, list[tuple[str, float]]],
+    bases: dict[str, int] | None = None,
+    fees: dict[str, FeeModel] | None = None,
+    endings: dict[str, PriceEndings] | None = None,
+) -> RuleTable:
+    """Compila as regras; ``bases`` diz de qual preço (0 = novo, 1 = usado) cada tipo parte.
+
+    ``fees`` associa um FeeModel a cada tipo; tipos ausentes ficam sem custos. Sem ``fees``
+    as linhas não têm valor líquido. ``endings`` faz o mesmo com PriceEndings.
+    """
+    bases = {**_BASE_COLUMNS, **(bases or {})}
+    tipos = tuple(sys.intern(t) for t in rules)
+    if not tipos:
+        raise ValueError("Nenhum tipo de produto nas regras.")
+    entries, rule_tipo, rule_base, tipo_rules, cat_ws, mult_ws = [], [], [], [], [], []
+    for t, tipo in enumerate(tipos):
+        if tipo not in bases:
+            raise ValueError(f"Tipo de produto sem preço base conhecido: {tipo!r}.")
+        regras = rules[tipo]
+        if not regras:
+            raise ValueError(f"Tipo de produto sem regras: {tipo!r}.")
+        start = len(entries)
+        for label, mult in regras:
+            mult = float(mult)
+            if not mult > 0:
+                raise ValueError(f"Multiplicador inválido em {tipo!r}/{label!r}: {mult}.")
+            entries.append((tipo, sys.intern(label), mult))
+            rule_tipo.append(t)
+            rule_base.append(bases[tipo])
+        tipo_rules.append(range(start, len(entries)))
+        cat_ws.append(max(len("Categoria"), *(len(label) for label, _ in regras)))
+        mult_ws.append(max(len("Multiplicador"), *(len(f"{float(mult):.2f}") for _, mult in regras)))
+    multipliers = np.array([mult for _, _, mult in entries], dtype=np.float64)
+    base_index = np.array(rule_base, dtype=np.intp)
+    multipliers.setflags(write=False)
+    base_index.setflags(write=False)
+    fee_models = ending_models = None
+    key: list = [entries, rule_base]
+    if fees:
+        unknown = set(fees) - set(tipos)
+        if unknown:
+            raise ValueError(f"Custos para tipos sem regras: {', '.join(sorted(map(repr, unknown)))}.")
+        fee_models = tuple(fees.get(tipo, FeeModel()) for tipo in tipos)
+        key.append([astuple(f) for f in fee_models])
+    if endings:
+        unknown = set(endings) - set(tipos)
+        if unknown:
+            raise ValueError(f"Terminações para tipos sem regras: {', '.join(sorted(map(repr, unknown)))}.")
+        for tipo, e in endings.items():
+            bad = [f for f in e.finais if f not in PRICE_ENDINGS]
+            if bad or e.direcao not in ENDING_DIRECTIONS or not 0 <= e.tolerancia < 1:
+                raise ValueError(
+                    f"Terminações inválidas para {tipo!r}: {e} (finais: {', '.join(PRICE_ENDINGS)}; "
+                    f"direção: {', '.join(ENDING_DIRECTIONS)}; tolerância em [0, 1))."
+                )
+        ending_models = tuple(endings.get(tipo) for tipo in tipos)
+        key.append([e and astuple(e) for e in ending_models])
+    canonical = json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+    return RuleTable(
+        tipos=tipos,
+        entries=tuple(entries),
+        rule_tipo=tuple(rule_tipo),
+        rule_base=tuple(rule_base),
+        tipo_rules=tuple(tipo_rules),
+        categoria_widths=tuple(cat_ws),
+        multiplicador_widths=tuple(mult_ws),
+        multipliers=multipliers,
+        base_index=base_index,
+        version=hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16],
+        fees=fee_models,
+        endings=ending_models,
+    )
+
+
+RULE_TABLE = compile_rules(RULES)
+
+
+def _fee_model(spec, onde: str) -> FeeModel:
+    if not isinstance(spec, dict):
+        raise ValueError(f"Definição de custos inválida em {onde}.")
+    comissao = spec.get("comissao", ())
+    if isinstance(comissao, (int, float)):
+        comissao = [(0.0, comissao)]
+    faixas = []
+    for faixa in comissao:
+        if isinstance(faixa, dict):
+            faixas.append((float(faixa.get("a_partir_de", 0.0)), float(faixa["taxa"])))
+        else:
+            limite, taxa = faixa
+            faixas.append((float(limite), float(taxa)))
+    limites = [limite for limite, _ in faixas]
+    if limites != sorted(set(limites)) or any(limite < 0 for limite in limites):
+        raise ValueError(f"Faixas de comissão em {onde} precisam de limites crescentes e não negativos.")
+    if any(not 0 <= taxa < 1 for _, taxa in faixas):
+        raise ValueError(f"Comissão em {onde} deve ser uma fração em [0, 1).")
+    model = FeeModel(
+        comissao=tuple(faixas),
+        taxa_fixa=float(spec.get("taxa_fixa", 0.0)),
+        limite_taxa_fixa=float(spec.get("taxa_fixa_abaixo_de", FeeModel.limite_taxa_fixa)),
+        frete=float(spec.get("frete", 0.0)),
+        limite_frete=float(spec.get("frete_a_partir_de", FeeModel.limite_frete)),
+    )
+    if model.taxa_fixa < 0 or model.frete < 0:
+        raise ValueError(f"Taxa fixa e frete em {onde} não podem ser negativos.")
+    return model
+
+
+def _price_endings(spec, onde: str) -> PriceEndings:
+    if not isinstance(spec, dict):
+        raise ValueError(f"Definição de terminações inválida em {onde}.")
+    finais = spec.get("finais", PriceEndings.finais)
+    if isinstance(finais, (str, int)):
+        finais = [finais]
+    return PriceEndings(
+        finais=tuple(str(f).lstrip(",") for f in finais),
+        tolerancia=float(spec.get("tolerancia", PriceEndings.tolerancia)),
+        direcao=str(spec.get("direcao", PriceEndings.direcao)),
+    )
+
+
+def load_rules(path: Path) -> RuleTable:
+    """Carrega regras de um arquivo .toml ou .json e compila numa RuleTable.
+
+    Formato (TOML; o JSON tem a mesma estrutura)::
+
+        [tipos."Produto Novo"]
+        base = "novo"            # opcional para "Produto Novo" e "Produto Usado"
+        regras = [
+            { categoria = "Preço Competitivo", multiplicador = 0.95 },
+        ]
+        taxas = { comissao = 0.13 }  # opcional; substitui a seção [taxas] para este tipo
+        terminacoes = { finais = ["99"] }  # opcional; idem para [terminacoes]
+
+        [taxas]                  # opcional: custos do anúncio, valem para todos os tipos
+        comissao = [{ a_partir_de = 0, taxa = 0.14 }, { a_partir_de = 1000, taxa = 0.12 }]
+        taxa_fixa = 6.25         # por unidade, em preços abaixo de taxa_fixa_abaixo_de
+        taxa_fixa_abaixo_de = 79
+        frete = 20.0             # subsídio do frete grátis, a partir de frete_a_partir_de
+        frete_a_partir_de = 79
+
+        [terminacoes]            # opcional: preço final com terminação psicológica
+        finais = ["90", "99", "9"]   # ",90", ",99" e reais terminados em 9
+        tolerancia = 0.02        # distância máxima, como fração do preço otimizado
+        direcao = "proximo"      # ou "abaixo": nunca acima do preço otimizado
+    """
+    with open(path, "rb") as f:
+        if path.suffix.lower() == ".toml":
+            data = tomllib.load(f)
+        elif path.suffix.lower() == ".json":
+            data = json.load(f)
+        else:
+            raise ValueError(f"Formato de regras desconhecido: '{path.suffix}' (use .toml ou .json).")
+    tipos = data.get("tipos") if isinstance(data, dict) else None
+    if not isinstance(tipos, dict):
+        raise ValueError("O arquivo de regras precisa de uma seção 'tipos'.")
+    rules: dict[str, list[tuple[str, float]]] = {}
+    bases: dict[str, int] = {}
+    fees: dict[str, FeeModel] = {}
+    endings: dict[str, PriceEndings] = {}
+    default_fees = data.get("taxas")
+    default_endings = data.get("terminacoes")
+    for tipo, spec in tipos.items():
+        if not isinstance(spec, dict):
+            raise ValueError(f"Definição inválida para o tipo {tipo!r}.")
+        base = spec.get("base")
+        if base is not None:
+            if base not in _BASE_NAMES:
+                raise ValueError(f"Base inválida para {tipo!r}: {base!r} (use 'novo' ou 'usado').")
+            bases[tipo] = _BASE_NAMES[base]
+        regras = []
+        for regra in spec.get("regras", []):
+            if isinstance(regra, dict):
+                regras.append((str(regra["categoria"]), float(regra["multiplicador"])))
+            else:
+                label, mult = regra
+                regras.append((str(label), float(mult)))
+        rules[tipo] = regras
+        if "taxas" in spec:
+            fees[tipo] = _fee_model(spec["taxas"], f"tipos.{tipo!r}.taxas")
+        elif default_fees is not None:
+            fees[tipo] = _fee_model(default_fees, "[taxas]")
+        if "terminacoes" in spec:
+            endings[tipo] = _price_endings(spec["terminacoes"], f"tipos.{tipo!r}.terminacoes")
+        elif default_endings is not None:
+            endings[tipo] = _price_endings(default_endings, "[terminacoes]")
+    return compile_rules(rules, bases, fees, endings)
+
+
+class RuleSetWatcher:
+    """Mantém a RuleTable de um arquivo de regras atualizada enquanto o processo roda.
+
+    Uma thread verifica mtime/tamanho do arquivo a cada ``interval`` segundos e, se mudou,
+    compila a nova tabela fora do caminho crítico e troca a referência de uma vez; quem
+    precifica pega ``current()`` por lote e nunca espera. Um arquivo inválido é relatado
+    e a tabela anterior continua valendo.
+    """
+
+    def __init__(self, path: Path, interval: float = 1.0):
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self._stamp = self._stat()
+        self._table = load_rules(path)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> "RuleSetWatcher":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def current(self) -> RuleTable:
+        return self._table
+
+    def check(self) -> bool:
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            table = load_rules(self.path)
+        except (OSError, ValueError, KeyError, TypeError, tomllib.TOMLDecodeError) as e:
+            print(f"Regras em '{self.path}' ignoradas: {e}", file=sys.stderr)
+            return False
+        if table.version == self._table.version:
+            return False
+        self._table = table
+        self.reloads += 1
+        print(f"Regras recarregadas de '{self.path}' (versão {table.version}).", file=sys.stderr)
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rules-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+@dataclass(slots=True)
+class PriceRow:
+    """Uma linha (produto x regra): a tabela de regras, o índice da regra nela e o preço otimizado.
+
+    ``preco_final`` é o preço com a terminação do tipo (RuleTable.endings) e ``liquido`` o
+    preço anunciado depois dos custos (RuleTable.fees); ambos são None sem essa configuração.
+    """
+
+    table: RuleTable
+    rule: int
+    preco: float
+    liquido: float | None = None
+    preco_final: float | None = None
+
+    @property
+    def tipo(self) -> str:
+        return self.table.entries[self.rule][0]
+
+    @property
+    def tipo_index(self) -> int:
+        return self.table.rule_tipo[self.rule]
+
+    @property
+    def categoria(self) -> str:
+        return self.table.entries[self.rule][1]
+
+    @property
+    def multiplicador(self) -> float:
+        return self.table.entries[self.rule][2]
+
+    @property
+    def margem(self) -> float | None:
+        """Fração do preço anunciado que sobra depois dos custos."""
+        if self.liquido is None:
+            return None
+        preco = self.preco if self.preco_final is None else self.preco_final
+        return self.liquido / preco if preco else 0.0
+
+
+class StageStats:
+    __slots__ = ("calls", "items", "wall", "cpu", "bytes")
+
+    def __init__(self):
+        self.calls = self.items = self.bytes = 0
+        self.wall = self.cpu = 0.0
+
+
+class Metrics:
+    """Instrumentação opcional por estágio: chamadas, itens, tempo de parede, CPU e bytes gravados.
+
+    A CPU é a da thread que executa o estágio (time.thread_time), então estágios que rodam em
+    threads (pipeline) somam certo; PNGs renderizados em outros processos aparecem só como o
+    tempo em que o produtor esperou vaga no pool (``png_fila``).
+    """
+
+    def __init__(self):
+        self.stages: dict[str, StageStats] = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, wall: float, cpu: float, items: int = 0, nbytes: int = 0) -> None:
+        with self._lock:
+            st = self.stages.get(name)
+            if st is None:
+                st = self.stages[name] = StageStats()
+            st.calls += 1
+            st.items += items
+            st.wall += wall
+            st.cpu += cpu
+            st.bytes += nbytes
+
+    def as_dict(self) -> dict:
+        return {
+            "elapsed_seconds": time.perf_counter() - self.started,
+            "stages": {
+                name: {"calls": st.calls, "items": st.items, "wall_seconds": st.wall, "cpu_seconds": st.cpu,
+                       "bytes": st.bytes}
+                for name, st in self.stages.items()
+            },
+        }
+
+    def prometheus(self) -> str:
+        out = []
+        for metric, attr, kind, doc in (
+            ("mlpo_stage_calls_total", "calls", "counter", "Execuções do estágio."),
+            ("mlpo_stage_items_total", "items", "counter", "Itens processados pelo estágio."),
+            ("mlpo_stage_wall_seconds_total", "wall", "counter", "Tempo de parede no estágio."),
+            ("mlpo_stage_cpu_seconds_total", "cpu", "counter", "Tempo de CPU (da thread) no estágio."),
+            ("mlpo_stage_bytes_total", "bytes", "counter", "Bytes gravados pelo estágio."),
+        ):
+            out.append(f"# HELP {metric} {doc}")
+            out.append(f"# TYPE {metric} {kind}")
+            out.extend(f'{metric}{{stage="{name}"}} {getattr(st, attr)}' for name, st in self.stages.items())
+        out.append("# HELP mlpo_elapsed_seconds Tempo total da execução.")
+        out.append("# TYPE mlpo_elapsed_seconds gauge")
+        out.append(f"mlpo_elapsed_seconds {time.perf_counter() - self.started}")
+        return "\n".join(out) + "\n"
+
+    def summary_lines(self) -> list[str]:
+        elapsed = time.perf_counter() - self.started
+        lines = [
+            f"{'Estágio':<14}  {'chamadas':>9}  {'itens':>10}  {'parede (s)':>10}  {'CPU (s)':>8}  {'MB':>8}  {'itens/s':>10}",
+            "-" * 80,
+        ]
+        for name, st in sorted(self.stages.items(), key=lambda kv: -kv[1].wall):
+            rate = st.items / st.wall if st.wall > 0 else 0.0
+            lines.append(
+                f"{name:<14}  {st.calls:>9}  {st.items:>10}  {st.wall:>10.3f}  {st.cpu:>8.3f}  "
+                f"{st.bytes / 1e6:>8.2f}  {rate:>10.1f}"
+            )
+        lines.append(f"Tempo total: {elapsed:.3f} s")
+        return lines
+
+    def write(self, path: Path) -> None:
+        """Grava em JSON (.json) ou no formato texto do Prometheus (qualquer outra extensão)."""
+        if path.suffix.lower() == ".json":
+            text = json.dumps(self.as_dict(), indent=2, ensure_ascii=False) + "\n"
+        else:
+            text = self.prometheus()
+        path.write_text(text, encoding="utf-8")
+
+
+class _StageTimer:
+    __slots__ = ("_metrics", "_name", "_items", "_bytes", "_t0", "_c0")
+
+    def __init__(self, metrics: Metrics, name: str, items: int):
+        self._metrics, self._name, self._items, self._bytes = metrics, name, items, 0
+
+    def __enter__(self) -> "_StageTimer":
+        self._t0 = time.perf_counter()
+        self._c0 = time.thread_time()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._metrics.add(
+            self._name, time.perf_counter() - self._t0, time.thread_time() - self._c0, self._items, self._bytes
+        )
+
+    def __bool__(self) -> bool:
+        return True
+
+    def add(self, items: int = 0, nbytes: int = 0) -> None:
+        self._items += items
+        self._bytes += nbytes
+
+
+class _NullStage:
+    """Estágio sem instrumentação: um único objeto reaproveitado, sem relógio nem trava."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def __bool__(self) -> bool:
+        return False
+
+    def add(self, items: int = 0, nbytes: int = 0) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+_METRICS: Metrics | None = None
+
+
+def enable_metrics() -> Metrics:
+    global _METRICS
+    _METRICS = Metrics()
+    return _METRICS
+
+
+def disable_metrics() -> None:
+    global _METRICS
+    _METRICS = None
+
+
+def _stage(name: str, items: int = 0):
+    """``with _stage("png") as st: ...``; com a instrumentação desligada devolve _NULL_STAGE.
+
+    Medidas que custam algo para obter (tamanho de arquivo etc.) ficam atrás de ``if st:``.
+    """
+    return _NULL_STAGE if _METRICS is None else _StageTimer(_METRICS, name, items)
+
+
+_PRICE_RE = re.compile(r"\s*([-+]?)\s*(?:R\$)?\s*([-+]?)\s*([0-9][0-9.,]*|[.,][0-9]+)\s*")
+_SPACES_RE = re.compile(r"\s+")
+_GROUPED_RE = {
+    ".": re.compile(r"[0-9]{1,3}(?:\.[0-9]{3})+"),
+    ",": re.compile(r"[0-9]{1,3}(?:,[0-9]{3})+"),
+}
+
+
+def _is_grouped(num: str) -> bool:
+    """"1.234" / "12.345.678": grupos de 3 dígitos separados por ponto ("0.500" não é milhar).
+
+    Sem regex (caminho quente): os pontos têm de estar exatamente a cada 4 posições a partir
+    do fim, e o que sobra, só dígitos.
+    """
+    dots = num.count(".")
+    return (dots > 0 and num[-4::-4] == "." * dots and num[0] not in ".0"
+            and num.replace(".", "").isdecimal())
+
+
+@functools.lru_cache(maxsize=65536)
 def _parse_price(s: str) -> float:
-    s = s.strip().replace("R$", "").replace(" ", "")
-    if "," in s and "." in s:
-        s = s.replace(".", "").replace(",", ".")
-    elif "," in s:
-        s = s.replace(",", ".")
-    return float(s)
+    """Converte "R$ 3.966,00", "3966", "3,966.00", "-12,5"... em float.
 
+    Com "." e "," presentes, o último separador é o decimal (BR ou US). Com um só tipo de
+    separador, várias ocorrências são milhar ("1.234.567") e uma só é decimal ("3966,5",
+    "39.66"), exceto um "." seguido de exatamente 3 dígitos, que é sempre milhar, com ou
+    sem "R$" ("1.234" = 1234,00): centavos têm 2 casas e é assim que os anúncios escrevem.
 
-def _read_input(path: Path) -> tuple[str, float, float]:
-    with open(path, "r", encoding="utf-8") as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
+    Os formatos mais comuns ("R$ 1.234,56", "1234,56", "1.234") são resolvidos sem regex;
+    o resto passa pela análise completa.
+    """
+    if s.isdecimal():
+        return float(s)
+    int_part, comma, cents = s.strip().removeprefix("R$").lstrip().partition(",")
+    digits = int_part.replace(".", "")
+    if (digits.isdecimal() and (cents.isdecimal() or not comma)
+            and (len(digits) == len(int_part) or _is_grouped(int_part))):
+        return float(digits + "." + cents) if comma else float(digits)
+    m = _PRICE_RE.fullmatch(s) or _PRICE_RE.fullmatch(_SPACES_RE.sub("", s))
+    if m is None or (m[1] and m[2]):
+        raise ValueError(f"Preço inválido: {s!r}")
+    num = m[3]
+    dec_pos = max(num.rfind("."), num.rfind(","))
+    if dec_pos < 0:
+        digits = num
+    else:
+        sep = num[dec_pos]
+        other = "," if sep == "." else "."
+        if other in num:
+            int_part = num[:dec_pos]
+            if not _GROUPED_RE[other].fullmatch(int_part):
+                raise ValueError(f"Preço inválido: {s!r}")
+            digits = int_part.replace(other, "") + "." + num[dec_pos + 1:]
+        elif num.count(sep) == 1 and not (sep == "." and _is_grouped(num)):
+            digits = num.replace(",", ".")
+        elif _GROUPED_RE[sep].fullmatch(num):
+            digits = num.replace(sep, "")
+        else:
+            raise ValueError(f"Preço inválido: {s!r}")
+    value = float(digits)
+    return -value if "-" in (m[1], m[2]) else value
+
+
+def _parse_product(lines: list[str]) -> tuple[str, float, float]:
     if len(lines) < 3:
         raise ValueError("O arquivo precisa conter 3 linhas: nome do produto, preço novo, preço usado.")
     name = lines[0]
@@ -45,52 +669,671 @@ def _read_input(path: Path) -> tuple[str, float, float]:
     return name, p1, p2
 
 
+def _read_input(path: Path) -> tuple[str, float, float]:
+    with open(path, "r", encoding="utf-8-sig") as f:
+        lines = list(itertools.islice((ln.strip() for ln in f if ln.strip()), 3))
+    return _parse_product(lines)
+
+
+def _iter_product_blocks(path: Path) -> Iterator[tuple[int, list[str]]]:
+    """Percorre um arquivo com um ou mais produtos (blocos de 3 linhas não vazias)."""
+    block: list[str] = []
+    start = 0
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for lineno, ln in enumerate(f, 1):
+            ln = ln.strip()
+            if not ln:
+                continue
+            if not block:
+                start = lineno
+            block.append(ln)
+            if len(block) == 3:
+                yield start, block
+                block = []
+    if block:
+        yield start, block
+
+
+FEED_FORMATS = ("csv", "tsv", "jsonl")
+_FEED_SUFFIXES = {".csv": "csv", ".tsv": "tsv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+_FEED_FIELDS = {
+    "name": ("name", "nome", "produto", "product", "title", "titulo", "título"),
+    "new_price": ("new_price", "preco_novo", "preço_novo", "novo", "new"),
+    "used_price": ("used_price", "preco_usado", "preço_usado", "usado", "used"),
+}
+
+
+_DELTA_FIELDS = {
+    "sku": ("sku", "id", "item_id", "codigo", "código", "mlb"),
+    "new_price": _FEED_FIELDS["new_price"],
+    "used_price": _FEED_FIELDS["used_price"],
+    "name": _FEED_FIELDS["name"],
+}
+_DELTA_OPTIONAL = frozenset({"name"})
+
+
+class FeedRecord(NamedTuple):
+    name: str
+    new_price: float
+    used_price: float
+    line: int
+
+
+class DeltaRecord(NamedTuple):
+    sku: str
+    new_price: float
+    used_price: float
+    name: str | None
+    line: int
+
+
+def _feed_format(path: Path) -> str | None:
+    return _FEED_SUFFIXES.get(path.suffix.lower())
+
+
+def _feed_columns(
+    header: list[str], spec: dict[str, tuple[str, ...]] = _FEED_FIELDS, optional: frozenset = frozenset()
+) -> dict[str, int] | None:
+    normalized = [h.strip().lower() for h in header]
+    columns = {}
+    for field_name, aliases in spec.items():
+        idx = next((i for i, h in enumerate(normalized) if h in aliases), None)
+        if idx is None:
+            if field_name in optional:
+                continue
+            return None
+        columns[field_name] = idx
+    return columns
+
+
+def _feed_price(value) -> float:
+    if isinstance(value, bool):
+        raise ValueError(f"Preço inválido: {value!r}.")
+    try:
+        p = float(value) if isinstance(value, (int, float)) else _parse_price(str(value))
+    except OverflowError:
+        p = math.inf
+    if not math.isfinite(p) or p <= 0:
+        raise ValueError("Os preços precisam ser positivos e finitos.")
+    return p
+
+
+def _feed_prices(new_price, used_price) -> tuple[float, float]:
+    return _feed_price(new_price), _feed_price(used_price)
+
+
+def _feed_record(fields: dict, line: int) -> FeedRecord:
+    name = str(fields["name"] or "").strip()
+    if not name:
+        raise ValueError("Nome do produto vazio.")
+    return FeedRecord(name, *_feed_prices(fields["new_price"], fields["used_price"]), line)
+
+
+def _delta_record(fields: dict, line: int) -> DeltaRecord:
+    sku = str(fields["sku"] if fields["sku"] is not None else "").strip()
+    if not sku:
+        raise ValueError("SKU vazio.")
+    name = str(fields.get("name") or "").strip() or None
+    return DeltaRecord(sku, *_feed_prices(fields["new_price"], fields["used_price"]), name, line)
+
+
+def _iter_delimited(
+    f,
+    delimiter: str,
+    on_error: Callable[[int, str], None],
+    spec: dict[str, tuple[str, ...]] = _FEED_FIELDS,
+    build: Callable[[dict, int], NamedTuple] = _feed_record,
+    optional: frozenset = frozenset(),
+) -> Iterator:
+    reader = csv.reader(f, delimiter=delimiter)
+    columns = None
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # o leitor recomeça na linha seguinte
+            on_error(reader.line_num, f"Linha CSV inválida: {e}.")
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        if columns is None:
+            columns = _feed_columns(row, spec, optional)
+            if columns is not None:
+                continue
+            # sem cabeçalho reconhecido: colunas posicionais na ordem de ``spec``
+            columns = {field_name: i for i, field_name in enumerate(spec)}
+        try:
+            fields = {field_name: row[i] if i < len(row) else None for field_name, i in columns.items()}
+            if any(fields[k] is None for k in columns if k not in optional):
+                raise IndexError
+            yield build(fields, reader.line_num)
+        except (IndexError, ValueError) as e:
+            on_error(reader.line_num, str(e) if not isinstance(e, IndexError) else "Linha com colunas faltando.")
+
+
+def _iter_jsonl(
+    f,
+    on_error: Callable[[int, str], None],
+    spec: dict[str, tuple[str, ...]] = _FEED_FIELDS,
+    build: Callable[[dict, int], NamedTuple] = _feed_record,
+    optional: frozenset = frozenset(),
+) -> Iterator:
+    for lineno, ln in enumerate(f, 1):
+        if not ln.strip():
+            continue
+        try:
+            obj = json.loads(ln)
+            if not isinstance(obj, dict):
+                raise ValueError("Registro JSON precisa ser um objeto.")
+            fields = {}
+            for field_name, aliases in spec.items():
+                key = next((k for k in aliases if k in obj), None)
+                if key is None:
+                    if field_name in optional:
+                        continue
+                    raise ValueError(f"Campo ausente: {field_name}.")
+                fields[field_name] = obj[key]
+            yield build(fields, lineno)
+        except ValueError as e:
+            on_error(lineno, str(e))
+
+
+def _report_feed_error(lineno: int, message: str) -> None:
+    print(f"linha {lineno}: {message}", file=sys.stderr)
+
+
+def _decoded_lines(f, on_error: Callable[[int, str], None]) -> Iterator[str]:
+    """Linhas de um arquivo binário em UTF-8; uma linha que não decodifica é relatada e vira
+    uma linha vazia (ignorada pelos leitores), mantendo a numeração das seguintes. Um BOM no
+    início (planilhas exportadas no Windows) é descartado para não colar no primeiro cabeçalho."""
+    for lineno, raw in enumerate(f, 1):
+        try:
+            yield raw.decode("utf-8-sig" if lineno == 1 else "utf-8")
+        except UnicodeDecodeError as e:
+            on_error(lineno, f"Linha com bytes inválidos em UTF-8 ({e.reason}).")
+            yield "\n"
+
+
+def iter_feed(
+    path: Path, fmt: str | None = None, on_error: Callable[[int, str], None] = _report_feed_error
+) -> Iterator[FeedRecord]:
+    """Lê um feed CSV, TSV ou JSONL em streaming, um registro por vez (memória constante).
+
+    Linhas inválidas são entregues a ``on_error(linha, mensagem)`` e a leitura continua.
+    """
+    fmt = fmt or _feed_format(path)
+    if fmt not in FEED_FORMATS:
+        raise ValueError(f"Formato de feed desconhecido para '{path}' (opções: {', '.join(FEED_FORMATS)}).")
+    with open(path, "rb") as fb:
+        f = _decoded_lines(fb, on_error)
+        if fmt == "jsonl":
+            yield from _iter_jsonl(f, on_error)
+        else:
+            yield from _iter_delimited(f, "\t" if fmt == "tsv" else ",", on_error)
+
+
+def iter_delta_feed(
+    path: Path, fmt: str | None = None, on_error: Callable[[int, str], None] = _report_feed_error
+) -> Iterator[DeltaRecord]:
+    """Lê um feed de alterações (sku, preço novo, preço usado[, nome]) em CSV, TSV ou JSONL.
+
+    O nome só é obrigatório para SKUs que ainda não estão no PriceStore.
+    """
+    fmt = fmt or _feed_format(path)
+    if fmt not in FEED_FORMATS:
+        raise ValueError(f"Formato de feed desconhecido para '{path}' (opções: {', '.join(FEED_FORMATS)}).")
+    with open(path, "rb") as fb:
+        f = _decoded_lines(fb, on_error)
+        if fmt == "jsonl":
+            yield from _iter_jsonl(f, on_error, _DELTA_FIELDS, _delta_record, _DELTA_OPTIONAL)
+        else:
+            yield from _iter_delimited(
+                f, "\t" if fmt == "tsv" else ",", on_error, _DELTA_FIELDS, _delta_record, _DELTA_OPTIONAL
+            )
+
+
+_BRL_SEPARATORS = str.maketrans("_.", ".,")
+
+
 def _fmt_money(v: float) -> str:
-    inteiro, frac = divmod(abs(v), 1)
-    s_inteiro = f"{int(inteiro):,}".replace(",", ".")
-    s_frac = f"{frac:.2f}".split(".")[1]
-    return f"R$ {'-' if v < 0 else ''}{s_inteiro},{s_frac}"
-
-
-def _format_block(grupo_rows, titulo_visivel: str):
-    cat_w = max(len("Categoria"), *(len(r["Categoria"]) for r in grupo_rows))
-    mult_w = max(len("Multiplicador"), *(len(f"{r['Multiplicador']:.2f}") for r in grupo_rows))
-    preco_w = max(len("Preço Otimizado"), *(len(_fmt_money(r["Preço Otimizado"])) for r in grupo_rows))
-    header_line = f"{'Categoria':<{cat_w}}  {'Multiplicador':>{mult_w}}  {'Preço Otimizado':>{preco_w}}"
-    sep = "-" * len(header_line)
-    lines = [titulo_visivel, header_line, sep]
-    for r in grupo_rows:
-        lines.append(
-            f"{r['Categoria']:<{cat_w}}  {r['Multiplicador']:>{mult_w}.2f}  {_fmt_money(r['Preço Otimizado']):>{preco_w}}")
+    # o arredondamento do :.2f já leva o "vai um" para a parte inteira (2.995 -> "3.00")
+    return f"R$ {'-' if v < 0 else ''}{abs(v):_.2f}".translate(_BRL_SEPARATORS)
+
+
+_POW10 = 10 ** np.arange(19, dtype=np.int64)
+_FMT_ARRAY_MIN = 64
+_FMT_ARRAY_MAX = 2.0**53 / 100  # acima disso rint(v * 100) deixa de ser exato em centavos
+
+
+def _fmt_money_array(values, width: int = 0, pad: bool = True) -> list[str]:
+    """_fmt_money de um array inteiro, alinhado à direita em max(width, maior texto) colunas
+    (ou sem preenchimento, com ``pad=False``).
+
+    Os caracteres são montados numa matriz de bytes (N x largura) com operações NumPy,
+    uma coluna de dígitos por vez, e decodificados de uma só vez. Abaixo de
+    ``_FMT_ARRAY_MIN`` valores o custo fixo do NumPy não compensa e cada valor passa por
+    _fmt_money.
+    """
+    if len(values) < _FMT_ARRAY_MIN:
+        v = values
+    else:
+        v = np.asarray(values, dtype=np.float64).ravel()
+    n = len(v)
+    if n < _FMT_ARRAY_MIN or not np.all(np.abs(v) < _FMT_ARRAY_MAX):
+        texts = [_fmt_money(x) for x in (v.tolist() if isinstance(v, np.ndarray) else v)]
+        if not pad:
+            return texts
+        w = max(width, *map(len, texts)) if texts else width
+        return [t.rjust(w) for t in texts]
+    inteiros, centavos = np.divmod(np.rint(np.abs(_round2(v)) * 100).astype(np.int64), 100)
+    neg = v < 0
+    digitos = np.maximum(np.searchsorted(_POW10, inteiros, side="right"), 1)
+    lens = len("R$ ,00") + neg + digitos + (digitos - 1) // 3
+    w = max(int(lens.max()), width)
+    chars = np.full((n, w), ord(" "), dtype=np.uint8)
+    chars[:, w - 1] = ord("0") + centavos % 10
+    chars[:, w - 2] = ord("0") + centavos // 10
+    chars[:, w - 3] = ord(",")
+    q = inteiros
+    for k in range(int(digitos.max())):
+        col = w - 4 - k - k // 3
+        presente = digitos > k
+        if k and k % 3 == 0:
+            chars[:, col + 1] = np.where(presente, ord("."), ord(" "))
+        chars[:, col] = np.where(presente, ord("0") + q % 10, ord(" "))
+        q = q // 10
+    start = w - lens
+    linhas = np.arange(n)
+    chars[linhas, start] = ord("R")
+    chars[linhas, start + 1] = ord("$")
+    if neg.any():
+        chars[neg, start[neg] + 3] = ord("-")
+    text = chars.tobytes().decode("ascii")
+    if not pad:
+        return [text[i + s:i + w] for i, s in zip(range(0, n * w, w), start.tolist())]
+    return [text[i:i + w] for i in range(0, n * w, w)]
+
+
+class LayoutColumn(NamedTuple):
+    """Coluna da tabela de texto; ``cells`` formata a coluna de todas as linhas numa chamada só.
+
+    ``width(table, tipo_index)``, quando existe, dá a largura já calculada na RuleTable, usada
+    quando o bloco tem todas as regras do tipo; sem ela a largura é medida nas células.
+    """
+
+    header: str
+    cells: Callable[[list[PriceRow]], list[str]]
+    align: str = ">"
+    width: Callable[[RuleTable, int], int] | None = None
+
+
+def _categoria_cells(rows: list[PriceRow]) -> list[str]:
+    entries = rows[0].table.entries
+    return [entries[r.rule][1] for r in rows]
+
+
+def _multiplicador_cells(rows: list[PriceRow]) -> list[str]:
+    entries = rows[0].table.entries
+    return [f"{entries[r.rule][2]:.2f}" for r in rows]
+
+
+def _preco_cells(rows: list[PriceRow]) -> list[str]:
+    return _fmt_money_array([r.preco for r in rows], pad=False)
+
+
+def _final_cells(rows: list[PriceRow]) -> list[str]:
+    return _fmt_money_array([r.preco_final for r in rows], pad=False)
+
+
+def _liquido_cells(rows: list[PriceRow]) -> list[str]:
+    return _fmt_money_array([r.liquido for r in rows], pad=False)
+
+
+def _margem_cells(rows: list[PriceRow]) -> list[str]:
+    return [f"{r.margem:.1%}".replace(".", ",") for r in rows]
+
+
+def _categoria_width(table: RuleTable, t: int) -> int:
+    return table.categoria_widths[t]
+
+
+def _multiplicador_width(table: RuleTable, t: int) -> int:
+    return table.multiplicador_widths[t]
+
+
+DEFAULT_COLUMNS = (
+    LayoutColumn("Categoria", _categoria_cells, "<", _categoria_width),
+    LayoutColumn("Multiplicador", _multiplicador_cells, width=_multiplicador_width),
+    LayoutColumn("Preço Otimizado", _preco_cells),
+)
+# colunas extras, depois das padrão: regras com terminações (RuleTable.endings) e com custos (RuleTable.fees)
+ENDING_COLUMNS = (LayoutColumn("Preço Final", _final_cells),)
+NET_COLUMNS = (
+    LayoutColumn("Líquido", _liquido_cells),
+    LayoutColumn("Margem", _margem_cells),
+)
+
+
+def _columns_for(table: RuleTable) -> tuple[LayoutColumn, ...]:
+    columns = DEFAULT_COLUMNS
+    if table.endings is not None:
+        columns += ENDING_COLUMNS
+    if table.fees is not None:
+        columns += NET_COLUMNS
+    return columns
+
+
+def _layout_groups(
+    rows: list[PriceRow], columns: tuple[LayoutColumn, ...] | None = None
+) -> list[tuple[int, list[str]]]:
+    """Linhas de texto de cada tipo presente em ``rows``: [(tipo_index, linhas do bloco)].
+
+    Cada coluna é formatada uma única vez para todas as linhas; as linhas são agrupadas
+    por tipo numa só passada e cada célula é medida e alinhada uma vez. O custo é
+    linear em linhas x colunas. Sem ``columns``, as colunas vêm da tabela de regras
+    (terminações e custos acrescentam as suas).
+    """
+    if not rows:
+        return []
+    if columns is None:
+        columns = _columns_for(rows[0].table)
+    cells = [col.cells(rows) for col in columns]
+    pads = [str.ljust if col.align == "<" else str.rjust for col in columns]
+    # uma passada: trechos contíguos do mesmo tipo (o caso de compute_rows) viram fatias
+    table = rows[0].table
+    rule_tipo = table.rule_tipo
+    tipo_de = [rule_tipo[r.rule] for r in rows]
+    runs, start = [], 0
+    for i in range(1, len(rows) + 1):
+        if i == len(rows) or tipo_de[i] != tipo_de[start]:
+            runs.append((tipo_de[start], start, i))
+            start = i
+    if all(a[0] < b[0] for a, b in zip(runs, runs[1:])):
+        groups = []
+        for t, a, b in runs:
+            # bloco completo (a ordem de compute_rows): as larguras fixas vêm prontas da tabela
+            rng = table.tipo_rules[t]
+            full = b - a == len(rng) and rows[a].rule == rng.start and rows[b - 1].rule == rng.stop - 1
+            groups.append((t, [c[a:b] for c in cells], full))
+    else:
+        idx: dict[int, list[int]] = {}
+        for t, a, b in runs:
+            idx.setdefault(t, []).extend(range(a, b))
+        groups = [(t, [[c[i] for i in idx[t]] for c in cells], False) for t in sorted(idx)]
+    tipos = table.tipos
+    blocks = []
+    for t, col_cells, full in groups:
+        widths = [
+            col.width(table, t) if full and col.width is not None else max(len(col.header), *map(len, cs))
+            for col, cs in zip(columns, col_cells)
+        ]
+        header = "  ".join(pad(col.header, w) for col, pad, w in zip(columns, pads, widths))
+        lines = [tipos[t], header, "-" * len(header)]
+        aligned = [[pad(cell, w) for cell in cs] for pad, w, cs in zip(pads, widths, col_cells)]
+        lines.extend(map("  ".join, zip(*aligned)))
+        blocks.append((t, lines))
+    return blocks
+
+
+def _format_block(grupo_rows: list[PriceRow], titulo_visivel: str, columns=None) -> list[str]:
+    _, lines = _layout_groups(grupo_rows, columns)[0]
+    lines[0] = titulo_visivel
     return lines
 
 
-def compute_rows(preco_novo: float, preco_usado: float):
-    base_map = {"Produto Novo": preco_novo, "Produto Usado": preco_usado}
-    rows: list[dict] = []
-    for tipo, rules in RULES.items():
-        base = base_map[tipo]
-        rows.extend(
-            {
-                "Tipo": tipo,
-                "Categoria": label,
-                "Multiplicador": mult,
-                "Preço Otimizado": round(base * mult, 2),
-            }
-            for label, mult in rules
-        )
+def compute_rows(preco_novo: float, preco_usado: float, table: RuleTable | None = None) -> list[PriceRow]:
+    table = table or RULE_TABLE
+    bases = (preco_novo, preco_usado)
+    rows = [
+        PriceRow(table, i, round(bases[b] * mult, 2))
+        for i, (b, (_, _, mult)) in enumerate(zip(table.rule_base, table.entries))
+    ]
+    if table.fees is not None or table.endings is not None:
+        precos = np.array([[r.preco for r in rows]])
+        finais = snap_price_matrix(precos, table)
+        liquidos = net_price_matrix(precos if finais is None else finais, table)
+        for i, r in enumerate(rows):
+            if finais is not None:
+                r.preco_final = float(finais[0, i])
+            if liquidos is not None:
+                r.liquido = float(liquidos[0, i])
     return rows
 
 
-def _build_output_lines(rows, produto: str) -> list[str]:
+_SPLITTER = 134217729.0  # 2**27 + 1 (divisão de Veltkamp)
+
+
+def _round2(values) -> np.ndarray:
+    """Arredonda para 2 casas com o mesmo resultado de round(v, 2) elemento a elemento.
+
+    np.rint(v * 100) pode errar perto de empates (x,xx5) porque v * 100 já vem arredondado.
+    Nesses elementos o produto exato é reconstruído (v = hi + lo, com hi * 100 e lo * 100
+    exatos) para decidir o lado do empate; valores fora da faixa segura usam round().
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values * 100.0
+    mag = np.abs(rounded)
+    np.rint(rounded, out=rounded)
+    with np.errstate(invalid="ignore"):
+        # |frac - 0,5| em até 4 ulps; mag * 2**-50 cobre 4 * np.spacing(mag) sem calculá-lo
+        dist = np.abs(rounded) - mag
+        np.abs(dist, out=dist)
+        dist -= 0.5
+        np.abs(dist, out=dist)
+        suspect = dist <= mag * 2.0**-50
+    del dist
+    if suspect.any():
+        idx = np.nonzero(suspect)
+        x = np.abs(values[idx])
+        t = x * _SPLITTER
+        hi = t - (t - x)
+        lo = x - hi
+        m = np.floor(mag[idx])
+        d = (hi * 100.0 - (m + 0.5)) + lo * 100.0
+        k = np.where(d > 0, m + 1, np.where(d < 0, m, m + (m % 2)))
+        rounded[idx] = np.copysign(k, values[idx])
+    rounded /= 100.0
+    slow = ~(mag < 2.0**52) | (suspect & (mag < 2.0))
+    if slow.any():
+        idx = np.nonzero(slow)
+        rounded[idx] = [round(float(v), 2) for v in values[idx]]
+    return rounded
+
+
+def compute_price_matrix(precos_novos, precos_usados, table: RuleTable | None = None) -> np.ndarray:
+    """Preços otimizados de N produtos como matriz (N x regras), colunas na ordem de compute_rows."""
+    table = table or RULE_TABLE
+    bases = np.column_stack([np.asarray(precos_novos, dtype=np.float64), np.asarray(precos_usados, dtype=np.float64)])
+    return _round2(bases[:, table.base_index] * table.multipliers)
+
+
+def snap_price_matrix(matrix, table: RuleTable | None = None) -> np.ndarray | None:
+    """Preços finais com as terminações de cada tipo (mesmo formato da matriz), ou None sem terminações.
+
+    Tipos sem terminação mantêm o preço otimizado; cada PriceEndings é aplicado à fatia do
+    tipo inteira de uma vez.
+    """
+    table = table or RULE_TABLE
+    if table.endings is None:
+        return None
+    out = np.array(matrix, dtype=np.float64)
+    for rng, endings in zip(table.tipo_rules, table.endings):
+        if endings is not None:
+            out[:, rng.start:rng.stop] = endings.snap(out[:, rng.start:rng.stop])
+    return out
+
+
+def net_price_matrix(matrix, table: RuleTable | None = None) -> np.ndarray | None:
+    """Valores líquidos de uma matriz de preços anunciados (mesmo formato), ou None sem custos.
+
+    Cada tipo ocupa colunas contíguas; o FeeModel do tipo é aplicado à fatia inteira de uma vez.
+    """
+    table = table or RULE_TABLE
+    if table.fees is None:
+        return None
+    matrix = np.asarray(matrix, dtype=np.float64)
+    out = np.empty_like(matrix)
+    for rng, fee in zip(table.tipo_rules, table.fees):
+        out[:, rng.start:rng.stop] = fee.net(matrix[:, rng.start:rng.stop])
+    return out
+
+
+def _rows_from_prices(precos, table: RuleTable | None = None, liquidos=None, finais=None) -> list[PriceRow]:
+    table = table or RULE_TABLE
+    if liquidos is None and finais is None:
+        return [PriceRow(table, i, p) for i, p in enumerate(precos.tolist())]
+    liquidos = itertools.repeat(None) if liquidos is None else liquidos.tolist()
+    finais = itertools.repeat(None) if finais is None else finais.tolist()
+    return [PriceRow(table, i, p, q, f) for i, (p, q, f) in enumerate(zip(precos.tolist(), liquidos, finais))]
+
+
+def _rows_from_matrix(matrix: np.ndarray, table: RuleTable | None = None) -> list[list[PriceRow]]:
+    """As linhas de cada produto de uma matriz de preços, com finais e líquidos calculados de uma vez."""
+    table = table or RULE_TABLE
+    finais = snap_price_matrix(matrix, table)
+    liquidos = net_price_matrix(matrix if finais is None else finais, table)
+    if liquidos is None and finais is None:
+        return [_rows_from_prices(precos, table) for precos in matrix]
+    liquidos = itertools.repeat(None) if liquidos is None else liquidos
+    finais = itertools.repeat(None) if finais is None else finais
+    return [_rows_from_prices(precos, table, liq, fin) for precos, liq, fin in zip(matrix, liquidos, finais)]
+
+
+SWEEP_KINDS = ("margem", "undercut")
+
+
+class SweepTier(NamedTuple):
+    """Critério de um patamar da varredura.
+
+    ``margem``: o menor preço da grade cuja margem sobre o custo, (preço - custo) / preço,
+    é pelo menos ``value``. ``undercut``: o maior preço da grade até concorrente x (1 - value);
+    com ``min_margin``, só entre os preços que ainda têm essa margem.
+    """
+
+    label: str
+    kind: str
+    value: float
+    min_margin: float | None = None
+
+
+@dataclass(frozen=True)
+class SweepGrid:
+    start: float = 0.30
+    stop: float = 1.00
+    step: float = 0.001
+
+    def multipliers(self) -> np.ndarray:
+        if not (0 < self.start <= self.stop and self.step > 0):
+            raise ValueError(f"Grade de multiplicadores inválida: {self}.")
+        n = int(round((self.stop - self.start) / self.step)) + 1
+        return np.round(self.start + self.step * np.arange(n), 9)
+
+
+class SweepResult(NamedTuple):
+    tiers: tuple[SweepTier, ...]
+    multiplicadores: np.ndarray  # N x patamares; NaN onde nenhum candidato atende ao critério
+    precos: np.ndarray
+
+
+def sweep_tiers(
+    bases,
+    tiers: Iterable[SweepTier],
+    grid: SweepGrid = SweepGrid(),
+    custos=None,
+    concorrentes=None,
+    max_cells: int = 1 << 22,
+) -> SweepResult:
+    """Varre uma grade densa de multiplicadores por produto e escolhe um preço por patamar.
+
+    Para cada bloco de produtos a grade inteira vira uma matriz (produtos x candidatos) de
+    preços arredondados como em compute_rows; cada critério é uma máscara sobre essa matriz,
+    e o candidato escolhido sai de um argmax por linha (os preços crescem com o
+    multiplicador). ``max_cells`` limita o tamanho da matriz de um bloco.
+    """
+    tiers = tuple(tiers)
+    for tier in tiers:
+        if tier.kind not in SWEEP_KINDS:
+            raise ValueError(f"Critério de varredura desconhecido: {tier.kind!r} (opções: {', '.join(SWEEP_KINDS)}).")
+        if tier.kind == "margem" and not 0 <= tier.value < 1:
+            raise ValueError(f"Margem alvo fora de [0, 1) em {tier.label!r}: {tier.value}.")
+        if tier.kind == "margem" or tier.min_margin is not None:
+            if custos is None:
+                raise ValueError(f"O patamar {tier.label!r} precisa dos custos dos produtos.")
+        if tier.kind == "undercut" and concorrentes is None:
+            raise ValueError(f"O patamar {tier.label!r} precisa dos preços dos concorrentes.")
+    bases = np.asarray(bases, dtype=np.float64)
+    custos = None if custos is None else np.broadcast_to(np.asarray(custos, dtype=np.float64), bases.shape)
+    concorrentes = (
+        None if concorrentes is None else np.broadcast_to(np.asarray(concorrentes, dtype=np.float64), bases.shape)
+    )
+    mults = grid.multipliers()
+    n, g = len(bases), len(mults)
+    out_mult = np.full((n, len(tiers)), np.nan)
+    out_preco = np.full((n, len(tiers)), np.nan)
+    chunk = max(1, max_cells // g)
+    for a in range(0, n, chunk):
+        b = min(a + chunk, n)
+        precos = _round2(bases[a:b, None] * mults)
+        lucro = None if custos is None else precos - custos[a:b, None]
+        linhas = np.arange(b - a)
+        for t, tier in enumerate(tiers):
+            if tier.kind == "margem":
+                ok = lucro >= tier.value * precos
+                idx = np.argmax(ok, axis=1)
+            else:
+                ok = precos <= (concorrentes[a:b] * (1 - tier.value))[:, None]
+                if tier.min_margin is not None:
+                    ok &= lucro >= tier.min_margin * precos
+                idx = g - 1 - np.argmax(ok[:, ::-1], axis=1)
+            found = ok[linhas, idx]
+            out_mult[a:b, t] = np.where(found, mults[idx], np.nan)
+            out_preco[a:b, t] = np.where(found, precos[linhas, idx], np.nan)
+    return SweepResult(tiers, out_mult, out_preco)
+
+
+def iter_priced_rows(
+    records: Iterable[tuple[str, str, float, float]],
+    chunk_size: int = 1024,
+    table: RuleTable | Callable[[], RuleTable] | None = None,
+) -> Iterator[tuple[str, str, list[PriceRow]]]:
+    """Estágio de preço do pipeline: (origem, produto, novo, usado) -> (origem, produto, rows).
+
+    Acumula até ``chunk_size`` produtos e precifica cada bloco com compute_price_matrix.
+    ``table`` pode ser uma função (ex.: RuleSetWatcher.current), consultada a cada bloco.
+    """
+    get_table = table if callable(table) else (lambda: table)
+    it = iter(records)
+    while True:
+        with _stage("leitura") as st:
+            chunk = list(itertools.islice(it, chunk_size))
+            st.add(items=len(chunk))
+        if not chunk:
+            return
+        yield from _price_chunk(chunk, get_table())
+
+
+def _price_chunk(
+    chunk: list[tuple[str, str, float, float]], table: RuleTable | None = None
+) -> list[tuple[str, str, list[PriceRow]]]:
+    table = table or RULE_TABLE
+    with _stage("preco", len(chunk)):
+        matrix = compute_price_matrix([c[2] for c in chunk], [c[3] for c in chunk], table)
+        return [
+            (origem, produto, rows)
+            for (origem, produto, _, _), rows in zip(chunk, _rows_from_matrix(matrix, table))
+        ]
+
+
+def _build_output_lines(
+    rows: list[PriceRow], produto: str, columns: tuple[LayoutColumn, ...] | None = None
+) -> list[str]:
     all_lines = [f"Produto: {produto}", ""]
-    for i, tipo in enumerate(["Produto Novo", "Produto Usado"]):
-        grupo = [r for r in rows if r["Tipo"] == tipo]
-        if not grupo:
-            continue
-        all_lines.extend(_format_block(grupo, tipo))
-        if i == 0:
+    for n, (_, lines) in enumerate(_layout_groups(rows, columns)):
+        if n:
             all_lines.append("")
+        all_lines.extend(lines)
     return all_lines
 
 
@@ -99,17 +1342,39 @@ def print_table(rows, produto: str) -> None:
         print(line)
 
 
-def save_png_table(rows, produto: str, output_path: Path) -> Path:
+PNG_RENDERERS = ("matplotlib", "pillow")
+_PNG_FONTSIZE = 12
+_PNG_DPI = 200
+_PNG_LINE_HEIGHT = 1.10
+
+
+def save_png_table(rows, produto: str, output_path: Path, renderer: str = "matplotlib") -> Path:
     all_lines = _build_output_lines(rows, produto)
-    fontsize = 12
-    line_height = 1.10
+    if renderer == "pillow":
+        return _save_png_pillow(all_lines, output_path)
+    if renderer != "matplotlib":
+        raise ValueError(f"Renderizador desconhecido: {renderer!r} (opções: {', '.join(PNG_RENDERERS)}).")
+    return _save_png_matplotlib(all_lines, output_path)
+
+
+def render_png_bytes(rows, produto: str, renderer: str = "matplotlib") -> bytes:
+    buf = io.BytesIO()
+    save_png_table(rows, produto, buf, renderer)
+    return buf.getvalue()
+
+
+def _save_png_matplotlib(all_lines: list[str], output_path: Path) -> Path:
+    import matplotlib.pyplot as plt
+
+    fontsize = _PNG_FONTSIZE
+    line_height = _PNG_LINE_HEIGHT
     left_pad_in = right_pad_in = top_pad_in = bottom_pad_in = 0.35
     max_chars = max((len(ln) for ln in all_lines), default=60)
     char_w_in = (fontsize / 72.0) * 0.60
     fig_w_in = left_pad_in + max_chars * char_w_in + right_pad_in
     line_h_in = (fontsize / 72.0) * line_height
     fig_h_in = top_pad_in + len(all_lines) * line_h_in + bottom_pad_in
-    fig = plt.figure(figsize=(fig_w_in, fig_h_in), dpi=200)
+    fig = plt.figure(figsize=(fig_w_in, fig_h_in), dpi=_PNG_DPI)
     ax = fig.add_axes([0, 0, 1, 1])
     ax.set_axis_off()
     step_y = line_h_in / fig_h_in
@@ -118,11 +1383,132 @@ def save_png_table(rows, produto: str, output_path: Path) -> Path:
     for ln in all_lines:
         ax.text(x, y, ln, fontsize=fontsize, fontfamily="monospace", va="top", ha="left")
         y -= step_y
-    fig.savefig(output_path, bbox_inches="tight", pad_inches=0.02)
+    fig.savefig(output_path, format="png", bbox_inches="tight", pad_inches=0.02)
     plt.close(fig)
     return output_path
 
 
+@functools.lru_cache(maxsize=8)
+def _monospace_font(size_px: int):
+    from PIL import ImageFont
+
+    candidates = ["DejaVuSansMono.ttf"]
+    # a mesma fonte monoespaçada que o matplotlib usa, localizada sem importá-lo
+    spec = importlib.util.find_spec("matplotlib")
+    for loc in (spec.submodule_search_locations or []) if spec else []:
+        candidates.append(str(Path(loc) / "mpl-data" / "fonts" / "ttf" / "DejaVuSansMono.ttf"))
+    for candidate in candidates:
+        try:
+            return ImageFont.truetype(candidate, size_px)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size_px)
+
+
+_ATLAS_PRESET = (
+    "0123456789 R$.,-:%()/"
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    "áàâãéêíóôõúüçÁÀÂÃÉÊÍÓÔÕÚÜÇ"
+)
+
+
+def _fits_cells(ln: str) -> bool:
+    """True se cada ponto de código da linha ocupa exatamente uma célula monoespaçada."""
+    return ln.isascii() or not any(
+        unicodedata.combining(ch) or unicodedata.east_asian_width(ch) in "WF" for ch in ln
+    )
+
+
+class _GlyphAtlas:
+    """Glifos monoespaçados rasterizados uma vez por processo, montados por cópia de memória.
+
+    Cada caractere vira um bloco (tile_h x cell_w) em escala de cinza; uma imagem é composta
+    indexando os blocos de cada linha e combinando com np.minimum num buffer reaproveitado.
+    O bloco é mais alto que o passo da linha (descendentes de "ç", "g"...), por isso o minimum.
+    As linhas são normalizadas para NFC; as que ainda têm acentos combinantes ou caracteres
+    largos (CJK, emoji) não cabem numa célula por ponto de código e são desenhadas pelo Pillow.
+    """
+
+    def __init__(self, fontsize: int, dpi: int):
+        self.font = _monospace_font(round(fontsize * dpi / 72.0))
+        ascent, descent = self.font.getmetrics()
+        self.cell_w = round(self.font.getlength("M"))
+        self.line_h = round(self.font.size * _PNG_LINE_HEIGHT)
+        self.tile_h = max(self.line_h, ascent + descent)
+        self.pad = round(0.1 * dpi)
+        self._index: dict[str, int] = {}
+        self._tiles = np.full((64, self.tile_h, self.cell_w), 255, dtype=np.uint8)
+        self._buffer = np.empty((0, 0), dtype=np.uint8)
+        for ch in _ATLAS_PRESET:
+            self._glyph(ch)
+
+    def _glyph(self, ch: str) -> int:
+        idx = self._index.get(ch)
+        if idx is not None:
+            return idx
+        from PIL import Image, ImageDraw
+
+        idx = len(self._index)
+        if idx == len(self._tiles):
+            grown = np.full((2 * idx, self.tile_h, self.cell_w), 255, dtype=np.uint8)
+            grown[:idx] = self._tiles
+            self._tiles = grown
+        if not ch.isspace():
+            tile = Image.new("L", (self.cell_w, self.tile_h), 255)
+            ImageDraw.Draw(tile).text((0, 0), ch, font=self.font, fill=0)
+            self._tiles[idx] = np.asarray(tile)
+        self._index[ch] = idx
+        return idx
+
+    def _drawn_strip(self, ln: str) -> np.ndarray:
+        from PIL import Image, ImageDraw
+
+        tile = Image.new("L", (self._columns(ln) * self.cell_w, self.tile_h), 255)
+        ImageDraw.Draw(tile).text((0, 0), ln, font=self.font, fill=0)
+        return np.asarray(tile)
+
+    def _columns(self, ln: str) -> int:
+        if _fits_cells(ln):
+            return len(ln)
+        return math.ceil(self.font.getlength(ln) / self.cell_w)
+
+    def render(self, all_lines: list[str]) -> np.ndarray:
+        all_lines = [ln if unicodedata.is_normalized("NFC", ln) else unicodedata.normalize("NFC", ln)
+                     for ln in all_lines]
+        max_chars = max((self._columns(ln) for ln in all_lines), default=60)
+        width = 2 * self.pad + max_chars * self.cell_w
+        height = 2 * self.pad + len(all_lines) * self.line_h + (self.tile_h - self.line_h)
+        if self._buffer.shape[0] < height or self._buffer.shape[1] < width:
+            self._buffer = np.empty((max(height, self._buffer.shape[0]), max(width, self._buffer.shape[1])), np.uint8)
+        canvas = self._buffer[:height, :width]
+        canvas.fill(255)
+        y = self.pad
+        for ln in all_lines:
+            if ln.strip():
+                if _fits_cells(ln):
+                    codes = [self._glyph(ch) for ch in ln]
+                    strip = self._tiles[codes].transpose(1, 0, 2).reshape(self.tile_h, len(codes) * self.cell_w)
+                else:
+                    strip = self._drawn_strip(ln)
+                target = canvas[y:y + self.tile_h, self.pad:self.pad + strip.shape[1]]
+                np.minimum(target, strip, out=target)
+            y += self.line_h
+        return canvas
+
+
+@functools.lru_cache(maxsize=4)
+def _glyph_atlas(fontsize: int, dpi: int) -> _GlyphAtlas:
+    return _GlyphAtlas(fontsize, dpi)
+
+
+def _save_png_pillow(all_lines: list[str], output_path: Path) -> Path:
+    from PIL import Image
+
+    canvas = _glyph_atlas(_PNG_FONTSIZE, _PNG_DPI).render(all_lines)
+    Image.fromarray(canvas).save(output_path, format="PNG", dpi=(_PNG_DPI, _PNG_DPI))
+    return output_path
+
+
 def _slug_filename(name: str) -> str:
     norm = unicodedata.normalize("NFKD", name)
     ascii_only = norm.encode("ascii", "ignore").decode("ascii")
@@ -138,11 +1524,1455 @@ def _output_dir() -> Path:
     return out_dir
 
 
-def main() -> None:
-    if len(sys.argv) > 1:
-        path = Path(sys.argv[1]).expanduser()
+def _init_png_worker(renderer: str = "matplotlib") -> None:
+    # paga a preparação do renderizador usado uma vez por processo, não por imagem
+    if renderer == "pillow":
+        _glyph_atlas(_PNG_FONTSIZE, _PNG_DPI)
+    else:
+        import matplotlib.pyplot  # noqa: F401
+
+
+def _save_png_measured(rows, produto: str, output_path: Path, renderer: str) -> tuple[float, float, int]:
+    """save_png_table num processo do pool, devolvendo (parede, CPU, bytes) para a instrumentação do pai."""
+    t0, c0 = time.perf_counter(), time.process_time()
+    save_png_table(rows, produto, output_path, renderer)
+    return time.perf_counter() - t0, time.process_time() - c0, output_path.stat().st_size
+
+
+def _record_png_metrics(measured) -> None:
+    if _METRICS is not None and measured is not None:
+        wall, cpu, nbytes = measured
+        _METRICS.add("png", wall, cpu, 1, nbytes)
+
+
+class PngRenderPool:
+    """Renderiza PNGs em processos separados (o matplotlib não é thread-safe).
+
+    No máximo ``max_pending`` imagens ficam em voo; ``submit`` bloqueia até abrir vaga,
+    o que limita a memória quando a renderização é mais lenta que o preço/texto.
+    ``renderer`` diz qual backend os processos preparam ao subir.
+    """
+
+    def __init__(self, workers: int, max_pending: int | None = None, renderer: str = "matplotlib"):
+        from concurrent.futures import ProcessPoolExecutor
+
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_png_worker, initargs=(renderer,))
+        self._max_pending = max(1, max_pending or workers * 4)
+        self._pending: dict[Future, str] = {}
+        self.rendered = 0
+        self.failures: list[tuple[str, str]] = []
+
+    def __enter__(self) -> "PngRenderPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close(cancel=exc[0] is not None)
+
+    def submit(self, rows, produto: str, output_path: Path, origem: str = "", renderer: str = "matplotlib") -> None:
+        while len(self._pending) >= self._max_pending:
+            self._reap(FIRST_COMPLETED)
+        render = _save_png_measured if _METRICS is not None else save_png_table
+        fut = self._executor.submit(render, rows, produto, output_path, renderer)
+        self._pending[fut] = origem or str(output_path)
+
+    def _reap(self, return_when: str) -> None:
+        done, _ = wait(self._pending, return_when=return_when)
+        for fut in done:
+            origem = self._pending.pop(fut)
+            if fut.cancelled():
+                continue
+            err = fut.exception()
+            if err is None:
+                self.rendered += 1
+                if isinstance(fut.result(), tuple):
+                    _record_png_metrics(fut.result())
+            else:
+                self.failures.append((origem, f"PNG: {err}"))
+
+    def close(self, cancel: bool = False) -> None:
+        if cancel:
+            for fut in self._pending:
+                fut.cancel()
+        if self._pending:
+            self._reap("ALL_COMPLETED")
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+
+TABLE_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow", ".npz": "npz"}
+
+
+class ColumnarTableWriter:
+    """Grava as linhas de compute_rows de um lote inteiro num único arquivo colunar.
+
+    Parquet (.parquet) ou Arrow IPC (.arrow/.feather/.ipc) via pyarrow; sem pyarrow, ou com
+    extensão .npz, cai para um .npz com um conjunto de arrays por grupo de linhas. As linhas
+    são acumuladas até ``row_group_size`` e então descarregadas, mantendo a memória limitada.
+
+    Layout do .npz: ``tipos`` e ``categorias`` com os rótulos; para cada grupo k,
+    ``produtos_k`` (nomes únicos do grupo), ``produto_k`` (índice em produtos_k por linha),
+    ``tipo_k``/``categoria_k`` (índices nos rótulos), ``multiplicador_k``, ``preco_k``, ``final_k``
+    e ``liquido_k``. Preço final e líquido ficam nulos (NaN no .npz) quando as regras não têm
+    terminações ou custos.
+    """
+
+    def __init__(self, path: Path, row_group_size: int = 65536, table: RuleTable | None = None):
+        fmt = TABLE_FORMATS.get(path.suffix.lower())
+        if fmt is None:
+            raise ValueError(f"Extensão de tabela desconhecida: '{path.suffix}' (opções: {', '.join(TABLE_FORMATS)}).")
+        if fmt != "npz" and importlib.util.find_spec("pyarrow") is None:
+            path = path.with_suffix(".npz")
+            print(f"pyarrow não instalado; gravando tabela em '{path}'.", file=sys.stderr)
+            fmt = "npz"
+        self.path = path
+        self.format = fmt
+        self.row_group_size = max(1, row_group_size)
+        self.rows_written = 0
+        self._tipos: list[str] = []
+        self._categorias: list[str] = []
+        self._codes: dict[RuleTable, tuple[list[int], list[int]]] = {}
+        self._rule_codes(table or RULE_TABLE)
+        self._groups = 0
+        self._reset_buffers()
+        self._writer = None
+        self._sink = None
+        self._closed = False
+        if fmt == "npz":
+            self._sink = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def __enter__(self) -> "ColumnarTableWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _reset_buffers(self) -> None:
+        self._produtos: list[str] = []
+        self._produto: list[int] = []
+        self._tipo: list[int] = []
+        self._categoria: list[int] = []
+        self._mult: list[float] = []
+        self._preco: list[float] = []
+        self._final: list[float] = []
+        self._liquido: list[float] = []
+
+    def _rule_codes(self, table: RuleTable) -> tuple[list[int], list[int]]:
+        # rótulos só são acrescentados ao fim, então os dicionários antigos são prefixo dos novos
+        codes = self._codes.get(table)
+        if codes is None:
+            for tipo in table.tipos:
+                if tipo not in self._tipos:
+                    self._tipos.append(tipo)
+            for _, label, _ in table.entries:
+                if label not in self._categorias:
+                    self._categorias.append(label)
+            codes = (
+                [self._tipos.index(tipo) for tipo, _, _ in table.entries],
+                [self._categorias.index(label) for _, label, _ in table.entries],
+            )
+            self._codes[table] = codes
+        return codes
+
+    def add(self, produto: str, rows: list[PriceRow]) -> None:
+        p = len(self._produtos)
+        self._produtos.append(produto)
+        for r in rows:
+            rule_tipo, rule_categoria = self._rule_codes(r.table)
+            self._produto.append(p)
+            self._tipo.append(rule_tipo[r.rule])
+            self._categoria.append(rule_categoria[r.rule])
+            self._mult.append(r.multiplicador)
+            self._preco.append(r.preco)
+            self._final.append(np.nan if r.preco_final is None else r.preco_final)
+            self._liquido.append(np.nan if r.liquido is None else r.liquido)
+        if len(self._preco) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._preco:
+            return
+        if self.format == "npz":
+            k = f"{self._groups:05d}"
+            self._write_npz_array(f"produtos_{k}", np.array(self._produtos))
+            self._write_npz_array(f"produto_{k}", np.array(self._produto, dtype=np.int32))
+            self._write_npz_array(f"tipo_{k}", np.array(self._tipo, dtype=np.int8))
+            self._write_npz_array(f"categoria_{k}", np.array(self._categoria, dtype=np.int16))
+            self._write_npz_array(f"multiplicador_{k}", np.array(self._mult, dtype=np.float64))
+            self._write_npz_array(f"preco_{k}", np.array(self._preco, dtype=np.float64))
+            self._write_npz_array(f"final_{k}", np.array(self._final, dtype=np.float64))
+            self._write_npz_array(f"liquido_{k}", np.array(self._liquido, dtype=np.float64))
+        else:
+            self._write_arrow_group()
+        self.rows_written += len(self._preco)
+        self._groups += 1
+        self._reset_buffers()
+
+    def _write_npz_array(self, name: str, arr: np.ndarray) -> None:
+        with self._sink.open(f"{name}.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, arr, allow_pickle=False)
+
+    def _write_arrow_group(self) -> None:
+        import pyarrow as pa
+
+        produto_idx = np.array(self._produto, dtype=np.int32)
+        # dicionários com todos os rótulos vistos até aqui: entre grupos só crescem (deltas no IPC)
+        table = pa.table(
+            {
+                "Produto": pa.array(self._produtos, type=pa.string()).take(produto_idx),
+                "Tipo": pa.DictionaryArray.from_arrays(
+                    np.array(self._tipo, dtype=np.int8), pa.array(self._tipos)
+                ),
+                "Categoria": pa.DictionaryArray.from_arrays(
+                    np.array(self._categoria, dtype=np.int16), pa.array(self._categorias)
+                ),
+                "Multiplicador": pa.array(self._mult, type=pa.float64()),
+                "Preço Otimizado": pa.array(self._preco, type=pa.float64()),
+                "Preço Final": pa.array(np.array(self._final), type=pa.float64(), from_pandas=True),
+                "Preço Líquido": pa.array(np.array(self._liquido), type=pa.float64(), from_pandas=True),
+            }
+        )
+        if self._writer is None:
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+
+                self._writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+            else:
+                self._sink = pa.OSFile(str(self.path), "wb")
+                options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                self._writer = pa.ipc.new_file(self._sink, table.schema, options=options)
+        if not len(table):
+            return
+        if self.format == "parquet":
+            self._writer.write_table(table, row_group_size=len(table))
+        else:
+            self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        if self.format == "npz":
+            self._write_npz_array("tipos", np.array(self._tipos))
+            self._write_npz_array("categorias", np.array(self._categorias))
+        else:
+            if self._writer is None:
+                self._write_arrow_group()  # lote vazio: arquivo só com o esquema
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        self._closed = True
+
+
+class ConsolidatedReportWriter:
+    """Relatório único com o bloco de texto de cada produto, no lugar de um .txt por SKU.
+
+    Tudo passa por um único fluxo bufferizado. O índice ``<relatório>.idx`` (TSV: offset,
+    tamanho em bytes, produto) permite ler o bloco de um produto sem percorrer o arquivo;
+    os blocos são separados por uma linha em branco que não entra no tamanho.
+    """
+
+    def __init__(self, path: Path, buffer_size: int = 1 << 20):
+        self.path = path
+        self.index_path = path.with_name(path.name + ".idx")
+        self.entries = 0
+        self._offset = 0
+        self._f = open(path, "wb", buffering=buffer_size)
+        self._idx = open(self.index_path, "w", encoding="utf-8", buffering=buffer_size)
+        self._idx.write("offset\ttamanho\tproduto\n")
+
+    def __enter__(self) -> "ConsolidatedReportWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def bytes_written(self) -> int:
+        return self._offset
+
+    def add(self, produto: str, lines: list[str]) -> None:
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        if self.entries:
+            self._f.write(b"\n")
+            self._offset += 1
+        self._f.write(data)
+        self._idx.write(f"{self._offset}\t{len(data)}\t{' '.join(produto.split())}\n")
+        self._offset += len(data)
+        self.entries += 1
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+            self._idx.close()
+
+
+def load_report_index(index_path: Path) -> dict[str, tuple[int, int]]:
+    index = {}
+    with open(index_path, "r", encoding="utf-8") as f:
+        next(f, None)
+        for ln in f:
+            offset, length, produto = ln.rstrip("\n").split("\t", 2)
+            index[produto] = (int(offset), int(length))
+    return index
+
+
+def read_report_entry(report_path: Path, offset: int, length: int) -> str:
+    with open(report_path, "rb") as f:
+        f.seek(offset)
+        return f.read(length).decode("utf-8")
+
+
+class StoredPrices(NamedTuple):
+    sku: str
+    nome: str
+    preco_novo: float
+    preco_usado: float
+    versao: str
+    precos: np.ndarray
+
+
+class PriceStore:
+    """Última matriz de preços de cada SKU, persistida em SQLite para o modo incremental.
+
+    Cada SKU guarda os preços de entrada, a versão das regras e as linhas calculadas
+    (float64). Consultas e gravações são feitas só para os SKUs de cada lote de
+    alterações, então o custo de uma execução acompanha o tamanho do delta, não o do
+    catálogo.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS precos (
+            sku TEXT PRIMARY KEY,
+            nome TEXT NOT NULL,
+            preco_novo REAL NOT NULL,
+            preco_usado REAL NOT NULL,
+            versao TEXT NOT NULL,
+            precos BLOB NOT NULL
+        ) WITHOUT ROWID
+    """
+    _MAX_PARAMS = 500
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(self._SCHEMA)
+
+    def __enter__(self) -> "PriceStore":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self._conn.commit()
+        self._conn.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM precos").fetchone()[0]
+
+    def get_many(self, skus: Iterable[str]) -> dict[str, StoredPrices]:
+        skus = list(skus)
+        found = {}
+        for i in range(0, len(skus), self._MAX_PARAMS):
+            part = skus[i:i + self._MAX_PARAMS]
+            cursor = self._conn.execute(
+                f"SELECT * FROM precos WHERE sku IN ({','.join('?' * len(part))})", part
+            )
+            for sku, nome, novo, usado, versao, blob in cursor:
+                found[sku] = StoredPrices(sku, nome, novo, usado, versao, np.frombuffer(blob, dtype=np.float64))
+        return found
+
+    def put_many(self, entries: Iterable[StoredPrices]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO precos VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (e.sku, e.nome, e.preco_novo, e.preco_usado, e.versao, np.asarray(e.precos, dtype=np.float64).tobytes())
+                for e in entries
+            ),
+        )
+        self._conn.commit()
+
+
+def _change_entry(
+    sku: str, nome: str, rec: DeltaRecord, old: StoredPrices | None, rows: list[PriceRow], precos: np.ndarray
+) -> dict:
+    table = rows[0].table if rows else RULE_TABLE
+    comparable = old is not None and old.versao == table.version and len(old.precos) == len(precos)
+    linhas = [
+        {
+            "tipo": r.tipo,
+            "categoria": r.categoria,
+            "multiplicador": r.multiplicador,
+            "antes": float(old.precos[i]) if comparable else None,
+            "depois": r.preco,
+        }
+        for i, r in enumerate(rows)
+        if not comparable or old.precos[i] != precos[i]
+    ]
+    return {
+        "sku": sku,
+        "produto": nome,
+        "preco_novo": [old.preco_novo if old else None, rec.new_price],
+        "preco_usado": [old.preco_usado if old else None, rec.used_price],
+        "versao_regras": [old.versao if old else None, table.version],
+        "linhas": linhas,
+    }
+
+
+CATALOG_MAGIC = b"MLPCAT\x00\x01"
+_CATALOG_HEADER = struct.Struct("<8sIIQQQ")  # magic, versão, bytes/registro, registros, offset e tamanho dos nomes
+_CATALOG_HEADER_SIZE = 64
+_CATALOG_DTYPE = np.dtype([
+    ("sku", "<u8"),
+    ("nome_offset", "<u8"),
+    ("nome_tamanho", "<u4"),
+    ("_reservado", "<u4"),
+    ("preco_novo", "<f8"),
+    ("preco_usado", "<f8"),
+])
+
+
+def write_catalog(path: Path, records: Iterable[tuple[str, float, float]], first_sku: int = 0) -> int:
+    """Grava o catálogo binário de largura fixa a partir de (nome, novo, usado); devolve o nº de registros.
+
+    Layout: cabeçalho de 64 bytes, registros ``_CATALOG_DTYPE`` (40 bytes, little-endian) e por
+    fim os nomes em UTF-8, apontados por (nome_offset, nome_tamanho) relativos ao início dessa
+    área. Os SKUs são sequenciais a partir de ``first_sku``. Registros e nomes são gravados em
+    streaming; os nomes passam por um arquivo temporário.
+    """
+    batch = np.zeros(4096, dtype=_CATALOG_DTYPE)
+    count = names_size = 0
+    with open(path, "wb") as f, tempfile.TemporaryFile() as names:
+        f.write(b"\0" * _CATALOG_HEADER_SIZE)
+        n = 0
+        for nome, novo, usado in records:
+            encoded = nome.encode("utf-8")
+            batch[n] = (first_sku + count, names_size, len(encoded), 0, novo, usado)
+            names.write(encoded)
+            names_size += len(encoded)
+            count += 1
+            n += 1
+            if n == len(batch):
+                f.write(batch.tobytes())
+                n = 0
+        f.write(batch[:n].tobytes())
+        names.seek(0)
+        while chunk := names.read(1 << 20):
+            f.write(chunk)
+        f.seek(0)
+        f.write(_CATALOG_HEADER.pack(
+            CATALOG_MAGIC, 1, _CATALOG_DTYPE.itemsize, count,
+            _CATALOG_HEADER_SIZE + count * _CATALOG_DTYPE.itemsize, names_size,
+        ))
+    return count
+
+
+class Catalog:
+    """Catálogo binário aberto via numpy.memmap: abrir não lê os registros, e processos
+    diferentes que abrem o mesmo arquivo compartilham as páginas do cache do sistema."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(_CATALOG_HEADER.size)
+        if len(header) < _CATALOG_HEADER.size:
+            raise ValueError(f"Catálogo truncado: '{path}'.")
+        magic, _, itemsize, count, names_offset, names_size = _CATALOG_HEADER.unpack(header)
+        if magic != CATALOG_MAGIC or itemsize != _CATALOG_DTYPE.itemsize:
+            raise ValueError(f"Arquivo não é um catálogo binário compatível: '{path}'.")
+        self.records = (
+            np.memmap(path, dtype=_CATALOG_DTYPE, mode="r", offset=_CATALOG_HEADER_SIZE, shape=(count,))
+            if count else np.zeros(0, dtype=_CATALOG_DTYPE)
+        )
+        self._names = (
+            np.memmap(path, dtype=np.uint8, mode="r", offset=names_offset, shape=(names_size,))
+            if names_size else np.zeros(0, dtype=np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def skus(self) -> np.ndarray:
+        return self.records["sku"]
+
+    @property
+    def precos_novos(self) -> np.ndarray:
+        return self.records["preco_novo"]
+
+    @property
+    def precos_usados(self) -> np.ndarray:
+        return self.records["preco_usado"]
+
+    def name(self, i: int) -> str:
+        rec = self.records[i]
+        start = int(rec["nome_offset"])
+        return self._names[start:start + int(rec["nome_tamanho"])].tobytes().decode("utf-8")
+
+
+def _price_catalog_range(
+    catalog_path: Path, matrix_path: Path, start: int, stop: int, table: RuleTable, chunk_size: int
+) -> None:
+    catalog = Catalog(catalog_path)
+    out = np.load(matrix_path, mmap_mode="r+")
+    for a in range(start, stop, chunk_size):
+        b = min(a + chunk_size, stop)
+        out[a:b] = compute_price_matrix(catalog.precos_novos[a:b], catalog.precos_usados[a:b], table)
+    out.flush()
+
+
+def price_catalog(
+    catalog_path: Path,
+    matrix_path: Path,
+    table: RuleTable | None = None,
+    workers: int = 0,
+    chunk_size: int = 1 << 16,
+) -> np.ndarray:
+    """Precifica o catálogo inteiro numa matriz N x regras gravada em ``matrix_path`` (.npy mapeado).
+
+    Com ``workers`` > 1 o catálogo é dividido em faixas contíguas, uma por processo; cada
+    um mapeia os dois arquivos, sem copiar o catálogo nem a matriz entre processos.
+    """
+    table = table or RULE_TABLE
+    n = len(Catalog(catalog_path))
+    if n == 0:
+        np.save(matrix_path, np.zeros((0, len(table))))
+        return np.load(matrix_path)
+    out = np.lib.format.open_memmap(matrix_path, mode="w+", dtype=np.float64, shape=(n, len(table)))
+    del out
+    if workers > 1 and n > chunk_size:
+        from concurrent.futures import ProcessPoolExecutor
+
+        step = -(-n // workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_price_catalog_range, catalog_path, matrix_path, a, min(a + step, n), table, chunk_size)
+                for a in range(0, n, step)
+            ]
+            for fut in futures:
+                fut.result()
+    else:
+        _price_catalog_range(catalog_path, matrix_path, 0, n, table, chunk_size)
+    return np.load(matrix_path, mmap_mode="r")
+
+
+@dataclass(frozen=True)
+class OutputOptions:
+    png: bool = True
+    renderer: str = "matplotlib"
+
+    def fingerprint(self) -> str:
+        """Tudo o que muda os bytes dos arquivos por produto além do conteúdo das linhas."""
+        png = f"{self.renderer}@{_PNG_FONTSIZE}pt/{_PNG_DPI}dpi" if self.png else "sem-png"
+        return f"{png};linha={_PNG_LINE_HEIGHT}"
+
+
+_CACHE_FILENAME = ".preco_otimizado_cache.json"
+_CHANGELOG_FILENAME = "alteracoes_precos.jsonl"
+_MATRIX_FILENAME = "matriz_precos.npy"
+
+
+class OutputCache:
+    """Cache persistente das saídas por produto, endereçado pelo conteúdo.
+
+    A chave de cada produto é um hash de (nome, preços calculados, versão das regras,
+    configuração de saída). Se a chave gravada na execução anterior for a mesma e os
+    arquivos ainda existirem, PNG e .txt não são refeitos. Os preços entram já
+    multiplicados e arredondados: uma mudança no preço de entrada que não altera nenhuma
+    linha também não invalida a saída.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path: Path, options: OutputOptions = OutputOptions()):
+        self.path = path
+        self._salt = f"v{self.FORMAT_VERSION};{options.fingerprint()}".encode()
+        self._entries: dict[str, str] = {}
+        self._origins: dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("versao") == self.FORMAT_VERSION:
+                self._entries = dict(data["entradas"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # cache ilegível só custa uma regeneração completa
+            self._entries = {}
+
+    def __enter__(self) -> "OutputCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.save()
+
+    def key(self, rows: list[PriceRow], produto: str) -> str:
+        h = hashlib.blake2b(self._salt, digest_size=16)
+        table = rows[0].table if rows else RULE_TABLE
+        h.update(f"\0{table.version}\0{produto}\0".encode())
+        h.update(np.array([r.preco for r in rows], dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def lookup(self, name: str, key: str, paths: Iterable[Path]) -> bool:
+        fresh = self._entries.get(name) == key and all(p.exists() for p in paths)
+        if fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return fresh
+
+    def store(self, name: str, key: str, origem: str = "") -> None:
+        self._entries[name] = key
+        if origem:
+            self._origins[origem] = name
+
+    def discard_origins(self, origens: Iterable[str]) -> None:
+        """Esquece as entradas de produtos cuja saída falhou depois de registrada (ex.: PNG no pool)."""
+        for origem in origens:
+            name = self._origins.pop(origem, None)
+            if name is not None:
+                self._entries.pop(name, None)
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"versao": self.FORMAT_VERSION, "entradas": self._entries}, f, ensure_ascii=False)
+        tmp.replace(self.path)
+
+
+@dataclass
+class OutputSinks:
+    """Destinos compartilhados por todos os produtos de uma execução (todos opcionais)."""
+
+    png_pool: PngRenderPool | None = None
+    table: ColumnarTableWriter | None = None
+    report: ConsolidatedReportWriter | None = None
+    cache: OutputCache | None = None
+
+
+def _write_outputs(
+    rows,
+    produto: str,
+    out_dir: Path,
+    options: OutputOptions = OutputOptions(),
+    sinks: OutputSinks = OutputSinks(),
+    origem: str = "",
+) -> list[Path]:
+    base = f"preco_otimizado_{_slug_filename(produto)}"
+    png_path = out_dir / f"{base}.png"
+    txt_path = out_dir / f"{base}.txt"
+    written = []
+
+    key = None
+    if sinks.cache is not None:
+        with _stage("cache", 1):
+            key = sinks.cache.key(rows, produto)
+            expected = ([png_path] if options.png else []) + ([txt_path] if sinks.report is None else [])
+            fresh = sinks.cache.lookup(base, key, expected)
+        if fresh:
+            _write_aggregates(rows, produto, sinks, None)
+            return written
+
+    if options.png:
+        if sinks.png_pool is not None:
+            with _stage("png_fila", 1):
+                sinks.png_pool.submit(rows, produto, png_path, origem, options.renderer)
+        else:
+            with _stage("png", 1) as st:
+                save_png_table(rows, produto, png_path, options.renderer)
+                if st:
+                    st.add(nbytes=png_path.stat().st_size)
+        written.append(png_path)
+    with _stage("layout", 1):
+        lines = _build_output_lines(rows, produto)
+    if sinks.report is None:
+        with _stage("txt", 1) as st:
+            text = "\n".join(lines) + "\n"
+            with open(txt_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            if st:
+                st.add(nbytes=len(text.encode("utf-8")))
+        written.append(txt_path)
+    _write_aggregates(rows, produto, sinks, lines)
+    # só depois das gravações síncronas: uma falha acima deixa a entrada antiga, que não confere com
+    # a chave nova, e a próxima execução regrava; falhas do pool de PNG saem por discard_origins
+    if key is not None:
+        sinks.cache.store(base, key, origem)
+    return written
+
+
+def _write_aggregates(rows, produto: str, sinks: OutputSinks, lines: list[str] | None) -> None:
+    if sinks.report is not None:
+        with _stage("relatorio", 1) as st:
+            before = sinks.report.bytes_written
+            sinks.report.add(produto, lines if lines is not None else _build_output_lines(rows, produto))
+            st.add(nbytes=sinks.report.bytes_written - before)
+    if sinks.table is not None:
+        with _stage("tabela", len(rows)):
+            sinks.table.add(produto, rows)
+
+
+_GLOB_CHARS = frozenset("*?[")
+
+
+def _resolve_batch_sources(spec: str) -> list[Path]:
+    """Resolve a especificação de lote: diretório, glob, manifesto (@arquivo) ou arquivo multiproduto."""
+    if spec.startswith("@"):
+        manifest = Path(spec[1:]).expanduser()
+        sources = []
+        with open(manifest, "r", encoding="utf-8-sig") as f:
+            for ln in f:
+                ln = ln.strip()
+                if ln and not ln.startswith("#"):
+                    p = Path(ln).expanduser()
+                    sources.append(p if p.is_absolute() else manifest.parent / p)
+        return sources
+    path = Path(spec).expanduser()
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.is_file() and not p.name.startswith("."))
+    if _GLOB_CHARS & set(spec):
+        return sorted(Path(p) for p in glob.glob(str(path), recursive=True) if Path(p).is_file())
+    return [path]
+
+
+@dataclass
+class BatchSummary:
+    processed: int = 0
+    failures: list[tuple[str, str]] = field(default_factory=list)
+    outputs: list[Path] = field(default_factory=list)
+    elapsed: float = 0.0
+    rule_reloads: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    unchanged: int = 0
+
+    @property
+    def throughput(self) -> float:
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def lines(self, max_failures: int = 20) -> list[str]:
+        out = [
+            f"Produtos processados: {self.processed}",
+            f"Falhas: {len(self.failures)}",
+            f"Tempo total: {self.elapsed:.2f} s ({self.throughput:.1f} produtos/s)",
+        ]
+        if self.rule_reloads:
+            out.append(f"Regras recarregadas durante a execução: {self.rule_reloads}")
+        if self.unchanged:
+            out.append(f"SKUs sem alteração (ignorados): {self.unchanged}")
+        if self.cache_hits or self.cache_misses:
+            out.append(f"Cache de saída: {self.cache_hits} sem mudança (pulados), {self.cache_misses} regenerados")
+        out.extend(f"Arquivo gerado: {p.resolve()}" for p in self.outputs)
+        for origem, erro in self.failures[:max_failures]:
+            out.append(f" - {origem}: {erro}")
+        if len(self.failures) > max_failures:
+            out.append(f" ... e mais {len(self.failures) - max_failures} falhas")
+        return out
+
+
+def run_batch(
+    sources: Iterable[Path],
+    out_dir: Path,
+    options: OutputOptions = OutputOptions(),
+    chunk_size: int = 1024,
+    png_workers: int = 0,
+    png_queue_depth: int | None = None,
+    feed_format: str | None = None,
+    table_out: Path | None = None,
+    row_group_size: int = 65536,
+    report_out: Path | None = None,
+    rules: RuleTable | Callable[[], RuleTable] | None = None,
+    cache_path: Path | None = None,
+    store_path: Path | None = None,
+    changelog_out: Path | None = None,
+    pipeline: bool = False,
+    queue_depth: int = 4,
+) -> BatchSummary:
+    """Processa as fontes do lote; com ``store_path`` elas são feeds de alterações (modo incremental).
+
+    Com ``pipeline`` o lote roda em estágios assíncronos com filas limitadas (ver _run_pipeline);
+    ``png_workers`` passa a ser o número de processos do estágio de PNG (mínimo 1).
+    """
+    if pipeline and store_path is not None:
+        raise ValueError("O pipeline assíncrono não se aplica ao modo incremental (--store).")
+    summary = BatchSummary()
+    t0 = time.perf_counter()
+    sinks = OutputSinks()
+
+    def forget_failed_pngs() -> None:
+        if sinks.png_pool is not None:
+            sinks.cache.discard_origins(origem for origem, _ in sinks.png_pool.failures)
+
+    with ExitStack() as stack:
+        if cache_path is not None:
+            # entra antes do pool para sair depois dele, com as falhas de PNG já conhecidas
+            sinks.cache = stack.enter_context(OutputCache(cache_path, options))
+            stack.callback(forget_failed_pngs)
+        if options.png and pipeline:
+            sinks.png_pool = _PngJobs()
+        elif options.png and png_workers > 0:
+            sinks.png_pool = stack.enter_context(PngRenderPool(png_workers, png_queue_depth, options.renderer))
+        if table_out is not None:
+            initial = rules() if callable(rules) else rules
+            sinks.table = stack.enter_context(ColumnarTableWriter(table_out, row_group_size, initial))
+        if report_out is not None:
+            sinks.report = stack.enter_context(ConsolidatedReportWriter(report_out))
+        if store_path is not None:
+            store = stack.enter_context(PriceStore(store_path))
+            changelog = stack.enter_context(open(changelog_out or out_dir / _CHANGELOG_FILENAME, "a", encoding="utf-8"))
+            _run_delta_sources(
+                sources, out_dir, options, chunk_size, summary, sinks, store, changelog, feed_format, rules
+            )
+            summary.outputs.append(Path(changelog.name))
+        elif pipeline:
+            import asyncio
+
+            asyncio.run(_run_pipeline(
+                sources, out_dir, options, summary, sinks, chunk_size, queue_depth,
+                max(1, png_workers), png_queue_depth, feed_format, rules,
+            ))
+        else:
+            _run_batch_sources(sources, out_dir, options, chunk_size, summary, sinks, feed_format, rules)
+    if sinks.png_pool is not None:
+        summary.failures.extend(sinks.png_pool.failures)
+    if sinks.cache is not None:
+        summary.cache_hits, summary.cache_misses = sinks.cache.hits, sinks.cache.misses
+    if sinks.table is not None:
+        summary.outputs.append(sinks.table.path)
+    if sinks.report is not None:
+        summary.outputs.extend([sinks.report.path, sinks.report.index_path])
+    summary.elapsed = time.perf_counter() - t0
+    return summary
+
+
+def _iter_source_records(
+    sources: Iterable[Path], on_error: Callable[[str, str], None], feed_format: str | None = None
+) -> Iterator[tuple[str, str, float, float]]:
+    for source in sources:
+        try:
+            fmt = feed_format or _feed_format(source)
+            if fmt is not None:
+                for rec in iter_feed(source, fmt, lambda lineno, msg: on_error(f"{source}:{lineno}", msg)):
+                    yield f"{source}:{rec.line}", rec.name, rec.new_price, rec.used_price
+                continue
+            for lineno, block in _iter_product_blocks(source):
+                origem = f"{source}:{lineno}"
+                try:
+                    produto, preco_novo, preco_usado = _parse_product(block)
+                except ValueError as e:
+                    on_error(origem, str(e))
+                    continue
+                yield origem, produto, preco_novo, preco_usado
+        except (OSError, UnicodeDecodeError, ValueError, csv.Error) as e:
+            on_error(str(source), str(e))
+
+
+def _run_batch_sources(
+    sources: Iterable[Path],
+    out_dir: Path,
+    options: OutputOptions,
+    chunk_size: int,
+    summary: BatchSummary,
+    sinks: OutputSinks,
+    feed_format: str | None = None,
+    rules: RuleTable | Callable[[], RuleTable] | None = None,
+) -> None:
+    def on_error(origem: str, message: str) -> None:
+        summary.failures.append((origem, message))
+
+    records = _iter_source_records(sources, on_error, feed_format)
+    for origem, produto, rows in iter_priced_rows(records, chunk_size, rules):
+        try:
+            _write_outputs(rows, produto, out_dir, options, sinks, origem)
+        except Exception as e:
+            summary.failures.append((origem, str(e)))
+        else:
+            summary.processed += 1
+
+
+class _PngJobs:
+    """Faz as vezes do PngRenderPool em _write_outputs dentro do pipeline: só anota os PNGs,
+    que o estágio de renderização consome pela fila."""
+
+    def __init__(self):
+        self.jobs: list[tuple] = []
+        self.failures: list[tuple[str, str]] = []
+        self.rendered = 0
+
+    def submit(self, rows, produto: str, output_path: Path, origem: str = "", renderer: str = "matplotlib") -> None:
+        self.jobs.append((rows, produto, output_path, origem or str(output_path), renderer))
+
+    def take(self) -> list[tuple]:
+        jobs, self.jobs = self.jobs, []
+        return jobs
+
+
+async def _run_pipeline(
+    sources: Iterable[Path],
+    out_dir: Path,
+    options: OutputOptions,
+    summary: BatchSummary,
+    sinks: OutputSinks,
+    chunk_size: int = 1024,
+    queue_depth: int = 4,
+    png_workers: int = 1,
+    png_queue_depth: int | None = None,
+    feed_format: str | None = None,
+    rules: RuleTable | Callable[[], RuleTable] | None = None,
+) -> None:
+    """Lote em estágios: leitura -> preço -> texto -> PNG, com filas limitadas entre eles.
+
+    Leitura e gravação do texto rodam em threads (I/O sobreposto ao resto), o preço roda no
+    loop e os PNGs num pool de ``png_workers`` processos, um consumidor por processo. Cada
+    fila tem tamanho fixo (``queue_depth`` blocos de ``chunk_size`` produtos; ``png_queue_depth``
+    imagens), então um estágio lento faz os anteriores esperarem em vez de acumular memória.
+    Uma falha em qualquer estágio, ou o cancelamento (Ctrl+C), cancela todos e descarta os
+    PNGs ainda na fila do pool.
+    """
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+
+    def on_error(origem: str, message: str) -> None:
+        summary.failures.append((origem, message))
+
+    get_table = rules if callable(rules) else (lambda: rules)
+    records = _iter_source_records(sources, on_error, feed_format)
+    png_jobs = sinks.png_pool
+    renderers = png_workers if png_jobs is not None else 0
+    raw_q: asyncio.Queue = asyncio.Queue(queue_depth)
+    priced_q: asyncio.Queue = asyncio.Queue(queue_depth)
+    png_q: asyncio.Queue = asyncio.Queue(max(1, png_queue_depth or png_workers * 4))
+
+    def next_chunk() -> list:
+        with _stage("leitura") as st:
+            chunk = list(itertools.islice(records, chunk_size))
+            st.add(items=len(chunk))
+        return chunk
+
+    def write_chunk(chunk: list) -> list[tuple]:
+        for origem, produto, rows in chunk:
+            try:
+                _write_outputs(rows, produto, out_dir, options, sinks, origem)
+            except Exception as e:
+                summary.failures.append((origem, str(e)))
+            else:
+                summary.processed += 1
+        return png_jobs.take() if png_jobs is not None else []
+
+    async def reader() -> None:
+        while chunk := await asyncio.to_thread(next_chunk):
+            await raw_q.put(chunk)
+        await raw_q.put(None)
+
+    async def pricing() -> None:
+        while (chunk := await raw_q.get()) is not None:
+            await priced_q.put(_price_chunk(chunk, get_table()))
+        await priced_q.put(None)
+
+    async def writer() -> None:
+        while (chunk := await priced_q.get()) is not None:
+            for job in await asyncio.to_thread(write_chunk, chunk):
+                await png_q.put(job)
+        for _ in range(renderers):
+            await png_q.put(None)
+
+    async def render(executor: ProcessPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+        while (job := await png_q.get()) is not None:
+            rows, produto, path, origem, renderer = job
+            render_fn = _save_png_measured if _METRICS is not None else save_png_table
+            try:
+                result = await loop.run_in_executor(executor, render_fn, rows, produto, path, renderer)
+            except Exception as e:
+                png_jobs.failures.append((origem, f"PNG: {e}"))
+            else:
+                png_jobs.rendered += 1
+                if render_fn is _save_png_measured:
+                    _record_png_metrics(result)
+
+    executor = (
+        ProcessPoolExecutor(png_workers, initializer=_init_png_worker, initargs=(options.renderer,))
+        if renderers
+        else None
+    )
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for stage in (reader(), pricing(), writer()):
+                tg.create_task(stage)
+            for _ in range(renderers):
+                tg.create_task(render(executor))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _iter_delta_sources(
+    sources: Iterable[Path], on_error: Callable[[str, str], None], feed_format: str | None = None
+) -> Iterator[tuple[str, DeltaRecord]]:
+    for source in sources:
+        try:
+            for rec in iter_delta_feed(source, feed_format, lambda lineno, msg: on_error(f"{source}:{lineno}", msg)):
+                yield f"{source}:{rec.line}", rec
+        except (OSError, UnicodeDecodeError, ValueError, csv.Error) as e:
+            on_error(str(source), str(e))
+
+
+def _run_delta_sources(
+    sources: Iterable[Path],
+    out_dir: Path,
+    options: OutputOptions,
+    chunk_size: int,
+    summary: BatchSummary,
+    sinks: OutputSinks,
+    store: PriceStore,
+    changelog,
+    feed_format: str | None = None,
+    rules: RuleTable | Callable[[], RuleTable] | None = None,
+) -> None:
+    """Modo incremental: reprecifica só os SKUs do delta cujo preço, nome ou regras mudaram."""
+    def on_error(origem: str, message: str) -> None:
+        summary.failures.append((origem, message))
+
+    get_table = rules if callable(rules) else (lambda: rules or RULE_TABLE)
+    deltas = _iter_delta_sources(sources, on_error, feed_format)
+    carimbo = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    while True:
+        with _stage("leitura") as st:
+            chunk = list(itertools.islice(deltas, chunk_size))
+            st.add(items=len(chunk))
+        if not chunk:
+            return
+        table = get_table()
+        latest = {}
+        for origem, rec in chunk:
+            # o último registro de um SKU dentro do bloco vence
+            latest.pop(rec.sku, None)
+            latest[rec.sku] = (origem, rec)
+        with _stage("store", len(latest)):
+            stored = store.get_many(latest)
+        changed = []
+        for sku, (origem, rec) in latest.items():
+            old = stored.get(sku)
+            nome = rec.name or (old.nome if old is not None else None)
+            if nome is None:
+                on_error(origem, f"SKU novo sem nome: {sku}")
+                continue
+            if (
+                old is not None
+                and (old.nome, old.preco_novo, old.preco_usado, old.versao)
+                == (nome, rec.new_price, rec.used_price, table.version)
+            ):
+                summary.unchanged += 1
+                continue
+            changed.append((origem, sku, nome, rec, old))
+        if not changed:
+            continue
+        with _stage("preco", len(changed)):
+            matrix = compute_price_matrix(
+                [c[3].new_price for c in changed], [c[3].used_price for c in changed], table
+            )
+            priced = _rows_from_matrix(matrix, table)
+        updates = []
+        for (origem, sku, nome, rec, old), precos, rows in zip(changed, matrix, priced):
+            try:
+                _write_outputs(rows, nome, out_dir, options, sinks, origem)
+            except Exception as e:
+                summary.failures.append((origem, str(e)))
+                continue
+            summary.processed += 1
+            updates.append(StoredPrices(sku, nome, rec.new_price, rec.used_price, table.version, precos))
+            entry = _change_entry(sku, nome, rec, old, rows, precos)
+            changelog.write(json.dumps({"em": carimbo, **entry}, ensure_ascii=False) + "\n")
+        with _stage("store", len(updates)):
+            store.put_many(updates)
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Calcula preços otimizados para anúncios do Mercado Livre.")
+    parser.add_argument("input", nargs="?", help="arquivo com nome do produto, preço novo e preço usado")
+    parser.add_argument(
+        "--batch",
+        metavar="SPEC",
+        help="processa vários produtos: diretório, glob, manifesto (@lista.txt), arquivo multiproduto "
+        "ou feed .csv/.tsv/.jsonl",
+    )
+    parser.add_argument(
+        "--feed-format",
+        choices=FEED_FORMATS,
+        help="força o formato de feed das fontes do lote (padrão: pela extensão do arquivo)",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ENDEREÇO",
+        help="roda como servidor residente de cotações em [host:]porta ou unix:/caminho.sock",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=256,
+        metavar="N",
+        help="com --serve, máximo de pedidos processados ao mesmo tempo",
+    )
+    parser.add_argument("--output-dir", type=Path, help="diretório de saída (padrão: output/ ao lado de src/)")
+    parser.add_argument(
+        "--rules",
+        type=Path,
+        metavar="ARQUIVO",
+        help="carrega as regras de preço de um arquivo .toml ou .json em vez das regras embutidas",
+    )
+    parser.add_argument(
+        "--watch-rules",
+        type=float,
+        nargs="?",
+        const=1.0,
+        metavar="SEGUNDOS",
+        help="com --rules, recarrega o arquivo quando ele mudar durante a execução (padrão: verifica a cada 1 s)",
+    )
+    parser.add_argument("--no-png", action="store_true", help="não gera a imagem PNG (evita carregar o matplotlib)")
+    parser.add_argument(
+        "--renderer",
+        choices=PNG_RENDERERS,
+        default="matplotlib",
+        help="backend da imagem PNG: matplotlib (padrão) ou pillow (texto direto na imagem, bem mais rápido)",
+    )
+    parser.add_argument(
+        "--table-out",
+        type=Path,
+        metavar="ARQUIVO",
+        help="grava todas as linhas num único arquivo colunar (.parquet, .arrow ou .npz; .npz se faltar pyarrow)",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        metavar="ARQUIVO",
+        help="grava o texto de todos os produtos num único relatório (com índice ARQUIVO.idx) em vez de um .txt cada",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        metavar="ARQUIVO",
+        help="modo incremental: as fontes de --batch são feeds de alterações (sku, preço novo, preço usado[, nome]) "
+        "aplicados sobre a última matriz de preços guardada neste banco SQLite",
+    )
+    parser.add_argument(
+        "--changelog",
+        type=Path,
+        metavar="ARQUIVO",
+        help=f"com --store, acrescenta as alterações de preço em JSONL neste arquivo (padrão: {_CHANGELOG_FILENAME} "
+        "no diretório de saída)",
+    )
+    parser.add_argument(
+        "--build-catalog",
+        type=Path,
+        metavar="ARQUIVO",
+        help="com --batch, converte as fontes num catálogo binário de largura fixa em vez de gerar as saídas",
+    )
+    parser.add_argument(
+        "--catalog",
+        type=Path,
+        metavar="ARQUIVO",
+        help="precifica um catálogo binário (de --build-catalog) direto do disco mapeado em memória",
+    )
+    parser.add_argument(
+        "--matrix-out",
+        type=Path,
+        metavar="ARQUIVO",
+        help=f"com --catalog, arquivo .npy da matriz de preços (padrão: {_MATRIX_FILENAME} no diretório de saída)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        metavar="N",
+        help="com --catalog, processos que precificam faixas do catálogo em paralelo",
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const="",
+        metavar="ARQUIVO",
+        help="pula PNG/.txt de produtos sem mudança desde a última execução "
+        f"(padrão: {_CACHE_FILENAME} no diretório de saída)",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=65536,
+        metavar="N",
+        help="linhas por grupo gravado em --table-out (limita a memória)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="no modo lote, roda leitura, preço, texto e PNG como estágios assíncronos com filas limitadas",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=("cpu", "mem"),
+        help="roda sob cProfile (cpu) ou tracemalloc (mem) e grava relatório .txt + .pstats/.tracemalloc "
+        "no diretório de saída",
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="?",
+        const="",
+        metavar="ARQUIVO",
+        help="mede cada estágio (tempo, CPU, bytes, itens) e mostra um resumo no stderr; com ARQUIVO, "
+        "grava também em JSON (.json) ou no formato texto do Prometheus (outras extensões)",
+    )
+    parser.add_argument(
+        "--png-workers",
+        type=int,
+        default=0,
+        metavar="N",
+        help="no modo lote, renderiza PNGs em N processos em paralelo "
+        "(0 = na mesma thread; com --pipeline, mínimo 1)",
+    )
+    parser.add_argument(
+        "--png-queue-depth",
+        type=int,
+        metavar="N",
+        help="máximo de PNGs aguardando renderização (padrão: 4 x --png-workers)",
+    )
+    return parser.parse_args(argv)
+
+
+_PROFILE_TOP = 40
+
+
+class _PeakSnapshots:
+    """Guarda um snapshot do tracemalloc perto do pico de memória da execução.
+
+    Uma thread lê get_traced_memory a cada ``interval`` segundos e tira um snapshot novo
+    sempre que a memória viva passa ``growth`` x a do último; no fim, ``snapshot`` é o
+    retrato da maior memória vista (picos mais curtos que o intervalo escapam).
+    """
+
+    def __init__(self, interval: float = 0.02, growth: float = 1.1):
+        import tracemalloc
+
+        self.interval = interval
+        self.growth = growth
+        self.snapshot = None
+        self.size = 0
+        self._traced = tracemalloc
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def sample(self) -> None:
+        current, _ = self._traced.get_traced_memory()
+        if current > self.size * self.growth:
+            self.snapshot = self._traced.take_snapshot()
+            self.size = current
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self) -> None:
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="mem-peak", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sample()
+
+
+def _run_profiled(args: argparse.Namespace) -> None:
+    """Roda _main sob cProfile (cpu) ou tracemalloc (mem) e grava relatório + dados brutos no diretório de saída.
+
+    Só o processo principal é medido; PNGs renderizados por --png-workers ficam de fora. O
+    relatório de memória compara com um snapshot do início: o crescimento até perto do pico
+    (amostrado por _PeakSnapshots) e o que ainda está vivo no fim.
+    """
+    out_dir = args.output_dir.expanduser() if args.output_dir else _output_dir()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    base = out_dir / f"perfil_{args.profile}_{time.strftime('%Y%m%d-%H%M%S')}"
+    if args.profile == "cpu":
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            _main(args)
+        finally:
+            profiler.disable()
+            raw = base.with_suffix(".pstats")
+            profiler.dump_stats(raw)
+            buf = io.StringIO()
+            stats = pstats.Stats(profiler, stream=buf).strip_dirs()
+            for key in ("tottime", "cumulative"):
+                buf.write(f"=== {_PROFILE_TOP} funções mais caras por {key} ===\n")
+                stats.sort_stats(key).print_stats(_PROFILE_TOP)
+            report = base.with_suffix(".txt")
+            report.write_text(buf.getvalue(), encoding="utf-8")
+            print(f"\nPerfil de CPU: {report.resolve()} (dados brutos: {raw.resolve()})", file=sys.stderr)
+        return
+
+    import tracemalloc
+
+    tracemalloc.start(10)
+    baseline = tracemalloc.take_snapshot()
+    sampler = _PeakSnapshots()
+    sampler.start()
+    try:
+        _main(args)
+    finally:
+        sampler.stop()
+        final = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        at_peak = sampler.snapshot or final
+        raw = base.with_suffix(".tracemalloc")
+        at_peak.dump(str(raw))
+        ignore = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        )
+        baseline, final, at_peak = (snap.filter_traces(ignore) for snap in (baseline, final, at_peak))
+        lines = [
+            f"Memória rastreada: pico {peak / 1e6:.2f} MB; perto do pico (amostra) {sampler.size / 1e6:.2f} MB; "
+            f"no fim {current / 1e6:.2f} MB",
+            "",
+            f"=== {_PROFILE_TOP} linhas que mais cresceram do início até perto do pico ===",
+        ]
+        lines.extend(str(stat) for stat in at_peak.compare_to(baseline, "lineno")[:_PROFILE_TOP])
+        lines.extend(["", f"=== {_PROFILE_TOP} linhas com memória ainda viva no fim (diferença do início) ==="])
+        lines.extend(str(stat) for stat in final.compare_to(baseline, "lineno")[:_PROFILE_TOP])
+        lines.extend(["", "=== 10 maiores pilhas de alocação perto do pico ==="])
+        for stat in at_peak.statistics("traceback")[:10]:
+            lines.append(f"{stat.count} blocos, {stat.size / 1024:.1f} KiB")
+            lines.extend(f"    {frame}" for frame in stat.traceback.format())
+        report = base.with_suffix(".txt")
+        report.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        print(f"\nPerfil de memória: {report.resolve()} (snapshot do pico: {raw.resolve()}); pico {peak / 1e6:.2f} MB",
+              file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    run = _run_profiled if args.profile else _main
+    if args.metrics is None:
+        run(args)
+        return
+    metrics = enable_metrics()
+    try:
+        run(args)
+    finally:
+        disable_metrics()
+        print("\n" + "\n".join(metrics.summary_lines()), file=sys.stderr)
+        if args.metrics:
+            metrics.write(Path(args.metrics).expanduser())
+
+
+def _main(args: argparse.Namespace) -> None:
+    if args.table_out and args.table_out.suffix.lower() not in TABLE_FORMATS:
+        print(f"Extensão de --table-out não suportada: '{args.table_out.suffix}' (opções: {', '.join(TABLE_FORMATS)}).")
+        sys.exit(1)
+    out_dir = args.output_dir.expanduser() if args.output_dir else _output_dir()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    options = OutputOptions(png=not args.no_png, renderer=args.renderer)
+    cache_path = None
+    if args.cache is not None:
+        cache_path = Path(args.cache).expanduser() if args.cache else out_dir / _CACHE_FILENAME
+
+    rules: RuleTable | Callable[[], RuleTable] = RULE_TABLE
+    watcher = None
+    if args.rules:
+        try:
+            if args.watch_rules is not None and (args.batch or args.serve):
+                watcher = RuleSetWatcher(args.rules.expanduser(), args.watch_rules)
+                rules = watcher.current
+            else:
+                rules = load_rules(args.rules.expanduser())
+        except (OSError, ValueError, KeyError, TypeError, tomllib.TOMLDecodeError) as e:
+            print(f"Erro ao carregar regras de '{args.rules}': {e}")
+            sys.exit(1)
+
+    if args.serve:
+        from mercado_livre_price_server import PricingServer, serve
+
+        server = PricingServer(
+            rules,
+            renderer=args.renderer,
+            max_concurrency=args.max_concurrency,
+            png_workers=args.png_workers or 1,
+        )
+        with watcher if watcher is not None else ExitStack():
+            serve(args.serve, server)
+        return
+
+    if args.catalog:
+        table = rules() if callable(rules) else rules
+        matrix_path = args.matrix_out.expanduser() if args.matrix_out else out_dir / _MATRIX_FILENAME
+        t0 = time.perf_counter()
+        try:
+            matrix = price_catalog(args.catalog.expanduser(), matrix_path, table, args.workers)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao precificar o catálogo '{args.catalog}': {e}")
+            sys.exit(1)
+        elapsed = time.perf_counter() - t0
+        print(f"Produtos precificados: {matrix.shape[0]} x {matrix.shape[1]} regras (versão {table.version})")
+        print(f"Tempo total: {elapsed:.2f} s")
+        print(f"Arquivo gerado: {matrix_path.resolve()}")
+        return
+
+    if args.store and not args.batch:
+        print("--store precisa de --batch com o feed de alterações.")
+        sys.exit(1)
+    if args.store and args.pipeline:
+        print("--pipeline não se aplica ao modo incremental (--store).")
+        sys.exit(1)
+
+    if args.batch:
+        sources = _resolve_batch_sources(args.batch)
+        if not sources:
+            print(f"Nenhum arquivo de entrada encontrado para '{args.batch}'.")
+            sys.exit(1)
+        if args.build_catalog:
+            failures = []
+            records = _iter_source_records(sources, lambda origem, msg: failures.append((origem, msg)), args.feed_format)
+            catalog_path = args.build_catalog.expanduser()
+            count = write_catalog(catalog_path, ((produto, novo, usado) for _, produto, novo, usado in records))
+            print(f"Produtos no catálogo: {count}")
+            print(f"Falhas: {len(failures)}")
+            for origem, erro in failures[:20]:
+                print(f" - {origem}: {erro}")
+            print(f"Arquivo gerado: {catalog_path.resolve()}")
+            if failures:
+                sys.exit(2)
+            return
+        with watcher if watcher is not None else ExitStack():
+            summary = run_batch(
+                sources,
+                out_dir,
+                options,
+                png_workers=args.png_workers,
+                png_queue_depth=args.png_queue_depth,
+                feed_format=args.feed_format,
+                table_out=args.table_out.expanduser() if args.table_out else None,
+                row_group_size=args.row_group_size,
+                report_out=args.report.expanduser() if args.report else None,
+                rules=rules,
+                cache_path=cache_path,
+                store_path=args.store.expanduser() if args.store else None,
+                changelog_out=args.changelog.expanduser() if args.changelog else None,
+                pipeline=args.pipeline,
+            )
+        if watcher is not None:
+            summary.rule_reloads = watcher.reloads
+        print("\n".join(summary.lines()))
+        if summary.failures:
+            sys.exit(2)
+        return
+
+    if args.input:
+        path = Path(args.input).expanduser()
     else:
-        script_dir = Path(__file__).resolve().parent
         candidates = [Path(__file__).resolve().parent.parent / "input" / "product"]
         path = next((p for p in candidates if p.exists()), None)
         if path is None:
@@ -150,25 +2980,42 @@ def main() -> None:
             sys.exit(1)
 
     try:
-        produto, preco_novo, preco_usado = _read_input(path)
+        with _stage("leitura", 1):
+            produto, preco_novo, preco_usado = _read_input(path)
     except Exception as e:
         print(f"Erro ao ler arquivo de entrada '{path}': {e}")
         sys.exit(1)
 
-    rows = compute_rows(preco_novo, preco_usado)
-    print_table(rows, produto)
-
-    out_dir = _output_dir()
-    base = f"preco_otimizado_{_slug_filename(produto)}"
-    png_path = out_dir / f"{base}.png"
-    txt_path = out_dir / f"{base}.txt"
+    with _stage("preco", 1):
+        rows = compute_rows(preco_novo, preco_usado, rules)
+    with _stage("console", 1):
+        print_table(rows, produto)
 
-    save_png_table(rows, produto, png_path)
-    with open(txt_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(_build_output_lines(rows, produto)) + "\n")
+    with ExitStack() as stack:
+        sinks = OutputSinks()
+        if args.table_out:
+            sinks.table = stack.enter_context(
+                ColumnarTableWriter(args.table_out.expanduser(), args.row_group_size, rules)
+            )
+        if args.report:
+            sinks.report = stack.enter_context(ConsolidatedReportWriter(args.report.expanduser()))
+        if cache_path is not None:
+            sinks.cache = stack.enter_context(OutputCache(cache_path, options))
+        written = _write_outputs(rows, produto, out_dir, options, sinks)
+    if sinks.cache is not None and sinks.cache.hits:
+        print("\nPNG/.txt sem mudança desde a última execução (cache); nada regenerado.")
+    if sinks.table is not None:
+        written.append(sinks.table.path)
+    if sinks.report is not None:
+        written.extend([sinks.report.path, sinks.report.index_path])
 
-    print(f"\nArquivos gerados:\n - {png_path.resolve()}\n - {txt_path.resolve()}")
+    if written:
+        print("\nArquivos gerados:")
+        for p in written:
+            print(f" - {p.resolve()}")
 
 
 if __name__ == "__main__":
+    # o módulo do servidor importa este pelo nome: que encontre o mesmo módulo, não uma cópia
+    sys.modules.setdefault("mercado_livre_price_optimizer", sys.modules[__name__])
     main()
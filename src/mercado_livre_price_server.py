@@ -0,0 +1,289 @@
+"""Servidor residente de cotações do mercado_livre_price_optimizer (--serve).
+
+Fica num módulo à parte para que as execuções de linha de comando não paguem o import do
+asyncio e do servidor HTTP; o script só o importa quando recebe --serve.
+"""
+import asyncio
+import json
+import signal
+import sys
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from mercado_livre_price_optimizer import (
+    RULE_TABLE,
+    PriceRow,
+    RuleTable,
+    _build_output_lines,
+    _feed_record,
+    _init_png_worker,
+    _rows_from_matrix,
+    compute_price_matrix,
+    compute_rows,
+    render_png_bytes,
+)
+
+_HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+_MAX_BODY = 1 << 20
+
+
+def _rows_to_json(rows: list[PriceRow]) -> list[dict]:
+    out = []
+    for r in rows:
+        item = {"tipo": r.tipo, "categoria": r.categoria, "multiplicador": r.multiplicador, "preco_otimizado": r.preco}
+        if r.preco_final is not None:
+            item["preco_final"] = r.preco_final
+        if r.liquido is not None:
+            item["preco_liquido"] = r.liquido
+            item["margem"] = round(r.margem, 4)
+        out.append(item)
+    return out
+
+
+class _QuoteBatcher:
+    """Agrupa cotações concorrentes numa única chamada de compute_price_matrix.
+
+    O lote é oportunista: pega o primeiro pedido e tudo o que já estiver na fila (até
+    ``max_batch``), sem esperar por mais; sob carga os lotes crescem sozinhos e, ocioso,
+    um pedido isolado sai pelo caminho escalar de compute_rows. Uma exceção no cálculo (ou
+    ao recarregar as regras) é entregue a todos os pedidos do lote e o laço segue.
+    """
+
+    def __init__(self, rules: Callable[[], RuleTable], max_batch: int = 256):
+        self._rules = rules
+        self._max_batch = max_batch
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.batches = 0
+        self.quotes = 0
+
+    async def quote(self, preco_novo: float, preco_usado: float) -> list[PriceRow]:
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((preco_novo, preco_usado, fut))
+        return await fut
+
+    async def run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self._max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                table = self._rules()
+                if len(batch) == 1:
+                    novo, usado, _ = batch[0]
+                    results = [compute_rows(novo, usado, table)]
+                else:
+                    matrix = compute_price_matrix([b[0] for b in batch], [b[1] for b in batch], table)
+                    results = _rows_from_matrix(matrix, table)
+            except Exception as e:  # noqa: BLE001 - o erro vai para os pedidos do lote, não mata o laço
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, _, fut), rows in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(rows)
+            self.batches += 1
+            self.quotes += len(batch)
+
+
+class PricingServer:
+    """Servidor residente de cotações (HTTP/1.1 com keep-alive, em TCP ou socket Unix).
+
+    Mantém regras, fontes e renderizadores carregados entre pedidos. Rotas:
+
+    - ``GET /health``: estado, versão das regras e contadores.
+    - ``POST /quote[?format=json|text|png]``: corpo JSON ``{"name", "new_price", "used_price"}``
+      (ou uma lista deles, só em json); devolve as linhas de compute_rows, o texto de
+      _build_output_lines ou a imagem PNG.
+
+    ``max_concurrency`` limita pedidos em processamento; PNGs vão para um pool de processos
+    de ``png_workers`` (o matplotlib não é thread-safe) com no máximo 2 por processo em voo.
+    """
+
+    def __init__(
+        self,
+        rules: RuleTable | Callable[[], RuleTable] | None = None,
+        renderer: str = "pillow",
+        max_concurrency: int = 256,
+        png_workers: int = 1,
+        max_batch: int = 256,
+    ):
+        self._rules = rules if callable(rules) else (lambda table=rules or RULE_TABLE: table)
+        self.renderer = renderer
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._png_workers = max(1, png_workers)
+        self._png_limit = asyncio.Semaphore(2 * self._png_workers)
+        self._png_pool: ProcessPoolExecutor | None = None
+        self._batcher = _QuoteBatcher(self._rules, max_batch)
+        self._batcher_task: asyncio.Task | None = None
+        self.requests = 0
+
+    async def start(self) -> None:
+        self._png_pool = ProcessPoolExecutor(
+            max_workers=self._png_workers, initializer=_init_png_worker, initargs=(self.renderer,)
+        )
+        loop = asyncio.get_running_loop()
+        # aquece regras e renderizador antes de aceitar conexões
+        rows = compute_rows(100.0, 50.0, self._rules())
+        await loop.run_in_executor(self._png_pool, render_png_bytes, rows, "aquecimento", self.renderer)
+        self._batcher_task = asyncio.create_task(self._batcher.run())
+
+    async def close(self) -> None:
+        if self._batcher_task is not None:
+            self._batcher_task.cancel()
+        if self._png_pool is not None:
+            self._png_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                for ln in header_lines:
+                    name, _, value = ln.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    self._write_response(writer, *self._json(400, {"erro": "Content-Length inválido"}), False)
+                    break
+                if length > _MAX_BODY:
+                    self._write_response(writer, 413, "application/json", b'{"erro": "corpo grande demais"}', False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                async with self._limit:
+                    status, content_type, payload = await self._dispatch(method, target, body)
+                self._write_response(writer, status, content_type, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write_response(writer, status: int, content_type: str, payload: bytes, keep_alive: bool) -> None:
+        head = (
+            f"HTTP/1.1 {status} {_HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> tuple[int, str, bytes]:
+        self.requests += 1
+        url = urlsplit(target)
+        try:
+            if url.path == "/health":
+                if method != "GET":
+                    return self._json(405, {"erro": "use GET"})
+                return self._json(200, {
+                    "status": "ok",
+                    "rules_version": self._rules().version,
+                    "requests": self.requests,
+                    "batches": self._batcher.batches,
+                    "quotes": self._batcher.quotes,
+                })
+            if url.path == "/quote":
+                if method != "POST":
+                    return self._json(405, {"erro": "use POST"})
+                fmt = parse_qs(url.query).get("format", ["json"])[0]
+                return await self._quote(json.loads(body or b"null"), fmt)
+            return self._json(404, {"erro": f"rota desconhecida: {url.path}"})
+        except (ValueError, KeyError, TypeError) as e:
+            return self._json(400, {"erro": str(e)})
+        except Exception as e:  # noqa: BLE001 - o servidor não pode cair por um pedido
+            return self._json(500, {"erro": str(e)})
+
+    async def _quote(self, payload, fmt: str) -> tuple[int, str, bytes]:
+        if isinstance(payload, list):
+            if fmt != "json":
+                raise ValueError("Lotes só aceitam format=json.")
+            records = [_feed_record(p, i) for i, p in enumerate(payload)]
+            table = self._rules()
+            matrix = compute_price_matrix([r.new_price for r in records], [r.used_price for r in records], table)
+            return self._json(200, {
+                "rules_version": table.version,
+                "quotes": [
+                    {"produto": r.name, "rows": _rows_to_json(rows)}
+                    for r, rows in zip(records, _rows_from_matrix(matrix, table))
+                ],
+            })
+        if not isinstance(payload, dict):
+            raise ValueError("Corpo precisa ser um objeto JSON com name, new_price e used_price.")
+        rec = _feed_record(payload, 0)
+        rows = await self._batcher.quote(rec.new_price, rec.used_price)
+        if fmt == "json":
+            return self._json(200, {"produto": rec.name, "rules_version": rows[0].table.version, "rows": _rows_to_json(rows)})
+        if fmt == "text":
+            text = "\n".join(_build_output_lines(rows, rec.name)) + "\n"
+            return 200, "text/plain; charset=utf-8", text.encode("utf-8")
+        if fmt == "png":
+            async with self._png_limit:
+                loop = asyncio.get_running_loop()
+                png = await loop.run_in_executor(self._png_pool, render_png_bytes, rows, rec.name, self.renderer)
+            return 200, "image/png", png
+        raise ValueError(f"Formato desconhecido: {fmt!r} (use json, text ou png).")
+
+    @staticmethod
+    def _json(status: int, obj) -> tuple[int, str, bytes]:
+        return status, "application/json; charset=utf-8", json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+async def _serve(address: str, server: PricingServer, ready: Callable[[str], None] | None = None) -> None:
+    await server.start()
+    unix_path = None
+    if address.startswith("unix:"):
+        unix_path = Path(address[len("unix:"):])
+        unix_path.unlink(missing_ok=True)
+        srv = await asyncio.start_unix_server(server.handle_connection, path=str(unix_path))
+    else:
+        host, _, port = address.rpartition(":")
+        srv = await asyncio.start_server(server.handle_connection, host or "127.0.0.1", int(port))
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    bound = ", ".join(str(sock.getsockname()) for sock in srv.sockets)
+    print(f"Servidor de preços ouvindo em {bound}", file=sys.stderr)
+    if ready is not None:
+        ready(bound)
+    try:
+        async with srv:
+            await stop.wait()
+    finally:
+        await server.close()
+        if unix_path is not None:
+            unix_path.unlink(missing_ok=True)
+
+
+def serve(address: str, server: PricingServer | None = None) -> None:
+    """Roda o servidor até SIGINT/SIGTERM. ``address``: "[host:]porta" ou "unix:/caminho.sock"."""
+    asyncio.run(_serve(address, server or PricingServer()))
@@ -0,0 +1,50 @@
+"""_fmt_money escalar x _fmt_money_array x formatador antigo (ver benchmarks/bench_fmt_money.py)."""
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import bench_fmt_money as bench  # noqa: E402
+import mercado_livre_price_optimizer as mlpo  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        (0.9951, "R$ 1,00"),
+        (2.995, "R$ 3,00"),
+        (999.995, "R$ 1.000,00"),
+        (999999.996, "R$ 1.000.000,00"),
+        (0.995, "R$ 0,99"),  # 0.995 em float64 é 0.99499999...
+        (-1234.5, "R$ -1.234,50"),
+        (0.004, "R$ 0,00"),
+        (1234567.89, "R$ 1.234.567,89"),
+    ],
+)
+def test_scalar_carries_rounding_into_integer_part(value, expected):
+    assert mlpo._fmt_money(value) == expected
+
+
+@pytest.mark.parametrize("value", [0.995, 2.995, 999.995, 999999.996])
+def test_vectorized_carries_like_scalar(value):
+    batch = mlpo._fmt_money_array([value] * mlpo._FMT_ARRAY_MIN)
+    assert {s.lstrip() for s in batch} == {mlpo._fmt_money(value)}
+
+
+def test_edge_cases_match_scalar_and_legacy():
+    assert bench.check_properties(bench.EDGE_CASES, one_by_one=True) == []
+
+
+def test_random_values_match_scalar_and_legacy():
+    values = bench._random_values(20_000, random.Random(11))
+    assert bench.check_properties(values) == []
+
+
+def test_out_of_range_batch_falls_back_to_scalar():
+    values = [1.5] * mlpo._FMT_ARRAY_MIN + [mlpo._FMT_ARRAY_MAX * 4]
+    assert [s.lstrip() for s in mlpo._fmt_money_array(values)] == [mlpo._fmt_money(v) for v in values]